@@ -0,0 +1,91 @@
+"""Reading log files straight out of .zip and .tar bundles, without extracting them.
+
+Members are addressed by (archive path, member name). Zip archives allow
+random access, so members can be opened independently (and searched in
+parallel); tar archives, compressed ones in particular, are read as a single
+forward stream.
+"""
+import io
+import tarfile
+import zipfile
+import zlib
+
+try:
+    from lzma import LZMAError
+except ImportError: # Python built without lzma; .xz bundles cannot be opened at all then
+    LZMAError = OSError
+
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# What reading a damaged or truncated archive raises: a truncated .tar.gz ends
+# in EOFError, a corrupt deflate stream in zlib.error
+ARCHIVE_ERRORS = (OSError, EOFError, zlib.error, LZMAError, zipfile.BadZipFile, tarfile.TarError)
+
+
+class _ForwardStream(io.RawIOBase):
+    """Read-only, non-seekable view of a tar member.
+
+    Members of a streamed tar ('r|*') raise on seekable(), which
+    io.TextIOWrapper asks about; this adapter answers it.
+    """
+
+    def __init__(self, member_stream):
+        self._member_stream = member_stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._member_stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def is_archive(name):
+    return name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def supports_random_access(archive_path):
+    """Whether members can be opened independently of each other."""
+    return archive_path.lower().endswith(ZIP_SUFFIXES)
+
+
+def list_members(archive_path):
+    """Return (member name, uncompressed size) for every regular file in the archive."""
+    if supports_random_access(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            return [(info.filename, info.file_size) for info in archive.infolist() if not info.is_dir()]
+    with tarfile.open(archive_path, "r:*") as archive:
+        return [(member.name, member.size) for member in archive if member.isfile()]
+
+
+def open_member(archive_path, member):
+    """Open one member of a random-access archive as a binary stream.
+
+    Every call gets its own ZipFile handle, so this is safe from worker
+    threads. The handle is released once the returned stream is closed.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        return archive.open(member)
+
+
+def iter_member_streams(archive_path, members):
+    """Yield (member name, binary stream) for the wanted members in archive order.
+
+    Streams the archive once from start to end, which is the only efficient
+    way through a compressed tar. Each stream is only valid until the next
+    item is requested.
+    """
+    wanted = set(members)
+    if supports_random_access(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for name in members:
+                with archive.open(name) as stream:
+                    yield name, stream
+        return
+    with tarfile.open(archive_path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name in wanted:
+                stream = io.BufferedReader(_ForwardStream(archive.extractfile(member)))
+                yield member.name, stream
@@ -0,0 +1,917 @@
+"""Headless pieces of the log search: progress reporting, file selection and matching.
+
+Nothing in here touches tkinter, so it can be used from worker threads and
+from tools that run without a desktop session.
+"""
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from log_archive import (ARCHIVE_ERRORS, is_archive, iter_member_streams, list_members, open_member,
+                         supports_random_access)
+
+try:
+    import psutil # Optional: process memory on every platform (otherwise /proc is used where it exists)
+except ImportError:
+    psutil = None
+
+
+ProgressUpdate = namedtuple("ProgressUpdate", "message show_progress percent bytes_per_sec eta")
+
+
+def format_bytes(num_bytes):
+    """Human readable byte count (e.g. '12.3 MB')."""
+    size = float(num_bytes)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_eta(seconds):
+    """Compact remaining-time string (e.g. '1m 05s')."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressChannel:
+    """Latest-value-only progress channel between a worker and the UI.
+
+    Workers call report() as often as they like; it only overwrites the
+    current value under a lock. The UI calls poll() on a fixed timer and gets
+    at most one update per tick, so the UI cost is constant no matter how
+    many files or lines the worker goes through.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = None
+        self._version = 0
+        self._seen_version = 0
+        self._started = time.monotonic()
+        self._total_bytes = 0
+
+    def begin(self, message, total_bytes=0):
+        """Start timing a new operation of total_bytes bytes."""
+        with self._lock:
+            self._started = time.monotonic()
+            self._total_bytes = total_bytes
+        self.report(message, 0)
+
+    def report(self, message, done_bytes=None, show_progress=True, percent=None):
+        """Record the latest state; cheap enough to call per file or per chunk.
+
+        Either done_bytes (percent, rate and ETA are derived from it) or an
+        explicit percent can be given.
+        """
+        with self._lock:
+            rate = eta = None
+            if done_bytes is not None:
+                elapsed = time.monotonic() - self._started
+                if elapsed > 0 and done_bytes > 0:
+                    rate = done_bytes / elapsed
+                if self._total_bytes:
+                    if percent is None:
+                        percent = min(done_bytes / self._total_bytes, 1.0) * 100
+                    if rate:
+                        eta = max(self._total_bytes - done_bytes, 0) / rate
+            self._latest = ProgressUpdate(message, show_progress, percent or 0, rate, eta)
+            self._version += 1
+
+    def finish(self, message):
+        """Report a final message and hide the progress bar."""
+        self.report(message, show_progress=False)
+
+    def poll(self):
+        """Return the newest ProgressUpdate, or None if nothing changed since the last poll."""
+        with self._lock:
+            if self._version == self._seen_version:
+                return None
+            self._seen_version = self._version
+            return self._latest
+
+    @staticmethod
+    def describe(update):
+        """Status bar text for an update, including throughput and ETA when known."""
+        text = update.message
+        if update.show_progress and update.bytes_per_sec:
+            text += f"  ({format_bytes(update.bytes_per_sec)}/s"
+            if update.eta is not None:
+                text += f", ETA {format_eta(update.eta)}"
+            text += ")"
+        return text
+
+
+UI_QUEUE_SIZE = 64 # Pending UI callbacks before workers wait for the UI to catch up
+
+
+class UpdateQueue(queue.Queue):
+    """Bounded queue of UI callbacks.
+
+    Workers block in put() while it is full, so a fast scan cannot pile up
+    results faster than the UI shows them. After close() (the window is
+    gone) put() drops items instead of waiting, so workers can always finish.
+    """
+
+    def __init__(self, maxsize=UI_QUEUE_SIZE):
+        super().__init__(maxsize)
+        self.closed = False
+
+    def put(self, item, block=True, timeout=None):
+        if not block:
+            if not self.closed:
+                super().put(item, block=False) # Raises queue.Full
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            # Wait in short steps so close() is noticed
+            left = None if deadline is None else deadline - time.monotonic()
+            try:
+                return super().put(item, timeout=0.1 if left is None else max(0.0, min(0.1, left)))
+            except queue.Full:
+                if left is not None and left <= 0.1:
+                    raise
+
+    def close(self):
+        self.closed = True
+
+
+DEFAULT_MEMORY_BUDGET_MB = 512
+RSS_CHECK_INTERVAL = 1.0 # Seconds between process memory samples
+RECORD_BYTES = 21 # MatchTable columns per result line
+EXPORT_BATCH_LINES = 20000 # Result lines read back from the files at a time when exporting
+DISPLAY_LINE_OVERHEAD = 64 # Rough per-line cost of text shown in the viewer, on top of its characters
+TYPICAL_LINE_CHARS = 120 # Line length assumed when sizing a scan before its lines are seen
+
+
+def default_memory_budget():
+    """Memory budget in bytes: SEARCH_LOG_MEMORY_MB if set, else DEFAULT_MEMORY_BUDGET_MB."""
+    try:
+        megabytes = int(os.environ.get("SEARCH_LOG_MEMORY_MB", DEFAULT_MEMORY_BUDGET_MB))
+    except ValueError:
+        megabytes = DEFAULT_MEMORY_BUDGET_MB
+    return max(megabytes, 1) * 1024 * 1024
+
+
+def process_rss():
+    """Resident memory of this process in bytes, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError, IndexError):
+        return None
+
+
+def matches_memory(matches, shown=None):
+    """Estimated bytes to keep one FileMatches as records and display its first shown lines (default all)."""
+    shown = len(matches.line_nos) if shown is None else min(shown, len(matches.line_nos))
+    return len(matches.line_nos) * RECORD_BYTES + shown * DISPLAY_LINE_OVERHEAD + sum(map(len, matches.lines[:shown]))
+
+
+class MemoryBudget:
+    """Memory allowance for what one search or file view keeps.
+
+    Producers charge() the estimated size of results before keeping them.
+    Once the charges would pass the limit, or the process resident memory
+    already has, charge() returns False from then on and the caller falls
+    back to counting instead of keeping.
+    """
+
+    def __init__(self, limit_bytes=None):
+        self.limit = limit_bytes or default_memory_budget()
+        self.used = 0
+        self.exceeded = False
+        self._rss_checked = 0.0
+
+    def lines_left(self):
+        """About how many more result lines fit; 0 once the budget is used up."""
+        if self.exceeded:
+            return 0
+        return max(0, (self.limit - self.used) // (RECORD_BYTES + DISPLAY_LINE_OVERHEAD + TYPICAL_LINE_CHARS))
+
+    def charge(self, num_bytes):
+        if self.exceeded:
+            return False
+        if self.used + num_bytes > self.limit or self._rss_over_limit():
+            self.exceeded = True
+            return False
+        self.used += num_bytes
+        return True
+
+    def _rss_over_limit(self):
+        now = time.monotonic()
+        if now - self._rss_checked < RSS_CHECK_INTERVAL:
+            return False
+        self._rss_checked = now
+        rss = process_rss()
+        return rss is not None and rss > self.limit
+
+
+# Default selection: the extensions the app has always searched, plus Android logcat dumps
+DEFAULT_INCLUDE = ("*.log", "*.txt", "*.syslog", "*.logcat", "logcat.*")
+
+CONTEXT_LINES = 5 # Lines shown before/after a hit; blocks closer than this are merged
+READ_BUFFER_SIZE = 1024 * 1024 # Bytes read at a time when scanning a file
+MAX_LINE_BYTES = 32 * 1024 * 1024 # Longer lines are split into pieces of this size, each counted as a line
+ARCHIVE_WORKERS = 4 # Parallel readers for members of random-access archives
+
+
+UNREADABLE_ARCHIVE = "" # Member name of the entry that stands for an archive whose listing failed
+
+
+class ManifestEntry(namedtuple("ManifestEntry", "path size member")):
+    """One file to search. For a file inside an archive, path is the archive and member the name inside it."""
+
+    __slots__ = ()
+
+    def __new__(cls, path, size, member=None):
+        return super().__new__(cls, path, size, member)
+
+    @property
+    def label(self):
+        """Name shown in results, e.g. 'bundle.zip!/path/app.log' for archive members."""
+        return f"{self.path}!/{self.member}" if self.member else self.path
+
+
+def _glob_to_regex(pattern):
+    """Translate a gitignore-style glob ('*', '?', '[..]', '**') into a regex."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("(?:/.*)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + (3 if pattern.startswith("[!", i) else 2):]:
+            # A ']' right after '[' or '[!' is part of the set
+            end = pattern.index("]", i + (3 if pattern.startswith("[!", i) else 2))
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    try:
+        return re.compile("".join(parts) + r"\Z")
+    except re.error as e: # E.g. a reversed range like [z-a]
+        raise ValueError(f"invalid pattern {pattern!r}: {e}") from None
+
+
+class GlobPattern:
+    """One gitignore-style pattern.
+
+    Like .gitignore: a pattern without '/' matches the name at any depth, a
+    pattern containing '/' is matched against the path relative to the search
+    root, and a trailing '/' restricts it to directories. Matching is case
+    insensitive, as file selection has always been.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        text = pattern.strip().replace("\\", "/").lower()
+        self.dir_only = text.endswith("/")
+        text = text.strip("/")
+        self.anchored = "/" in text
+        self._regex = _glob_to_regex(text)
+
+    def matches(self, rel_path, is_dir=False):
+        if self.dir_only and not is_dir:
+            return False
+        rel_path = rel_path.lower()
+        if self.anchored:
+            return bool(self._regex.match(rel_path))
+        return bool(self._regex.match(rel_path.rsplit("/", 1)[-1]))
+
+
+def _split_patterns(patterns):
+    """Accept a list of patterns or a single comma/newline separated string."""
+    if isinstance(patterns, str):
+        patterns = re.split(r"[,\n]", patterns)
+    return [GlobPattern(p) for p in patterns if p and p.strip()]
+
+
+class FileFilter:
+    """Which files a folder search looks at.
+
+    Exclude patterns are checked on directories during the walk so excluded
+    trees (node_modules, core dumps, ...) are pruned and never enumerated.
+    """
+
+    def __init__(self, include=DEFAULT_INCLUDE, exclude=(), max_depth=None,
+                 max_file_size=None, modified_since=None, search_archives=True):
+        self.include = _split_patterns(include)
+        self.exclude = _split_patterns(exclude)
+        self.max_depth = max_depth # 0 = only files directly in the root folder
+        self.max_file_size = max_file_size # Bytes
+        if isinstance(modified_since, datetime):
+            modified_since = modified_since.timestamp()
+        self.modified_since = modified_since # Epoch seconds
+        self.search_archives = search_archives # Look inside .zip/.tar bundles
+
+    def accepts_dir(self, rel_path, depth):
+        """Whether the walk should descend into a directory at the given depth."""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        return not any(p.matches(rel_path, is_dir=True) for p in self.exclude)
+
+    def accepts_file(self, rel_path, stat_result=None):
+        if not any(p.matches(rel_path) for p in self.include):
+            return False
+        if any(p.matches(rel_path) for p in self.exclude):
+            return False
+        if stat_result is not None:
+            if self.max_file_size is not None and stat_result.st_size > self.max_file_size:
+                return False
+            if self.modified_since is not None and stat_result.st_mtime < self.modified_since:
+                return False
+        return True
+
+    def accepts_archive(self, rel_path, stat_result):
+        """Archives are selected by the exclude and modified-since rules only;
+        include patterns and the size limit apply to their members instead."""
+        if not self.search_archives or any(p.matches(rel_path) for p in self.exclude):
+            return False
+        return self.modified_since is None or stat_result.st_mtime >= self.modified_since
+
+    def accepts_member(self, name, size):
+        # Members are listed flat, so excluded directories are checked on each parent of the name
+        parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+        for end in range(1, len(parts)):
+            if any(p.matches("/".join(parts[:end]), is_dir=True) for p in self.exclude):
+                return False
+        if not self.accepts_file("/".join(parts)):
+            return False
+        return self.max_file_size is None or size <= self.max_file_size
+
+    def needs_stat(self):
+        return self.max_file_size is not None or self.modified_since is not None
+
+
+def iter_log_files(root, file_filter=None):
+    """Yield a ManifestEntry for every file under root selected by file_filter.
+
+    Uses os.scandir so the walk prunes excluded directories before listing
+    them and reuses the directory entry's cached stat where the OS provides it.
+    """
+    file_filter = file_filter or FileFilter()
+    stack = [(root, "", 0)]
+    while stack:
+        dir_path, rel_dir, depth = stack.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                entries = sorted(entries, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if file_filter.accepts_dir(rel_path, depth + 1):
+                        subdirs.append((entry.path, rel_path, depth + 1))
+                    continue
+                if not entry.is_file():
+                    continue
+                if is_archive(entry.name):
+                    if file_filter.accepts_archive(rel_path, entry.stat()):
+                        yield from iter_archive_entries(entry.path, file_filter)
+                    continue
+                if not file_filter.accepts_file(rel_path):
+                    continue
+                stat_result = entry.stat()
+                if file_filter.needs_stat() and not file_filter.accepts_file(rel_path, stat_result):
+                    continue
+            except OSError:
+                continue
+            yield ManifestEntry(entry.path, stat_result.st_size)
+        # Reverse so directories are visited in name order
+        stack.extend(reversed(subdirs))
+
+
+def iter_archive_entries(archive_path, file_filter=None):
+    """Yield a ManifestEntry for every selected member of an archive.
+
+    An archive that cannot be listed yields one UNREADABLE_ARCHIVE entry, so
+    the search reports it as an error instead of failing or skipping it.
+    """
+    file_filter = file_filter or FileFilter()
+    try:
+        members = list_members(archive_path)
+    except ARCHIVE_ERRORS:
+        # Stands for the whole archive; scanning it fails again and reports the error once
+        yield ManifestEntry(archive_path, 0, UNREADABLE_ARCHIVE)
+        return
+    for name, size in members:
+        if file_filter.accepts_member(name, size):
+            yield ManifestEntry(archive_path, size, name)
+
+
+def build_manifest(path, file_filter=None):
+    """List the files a search of path covers: a folder, an archive or a single file."""
+    if os.path.isdir(path):
+        return list(iter_log_files(path, file_filter))
+    if is_archive(path) and (file_filter or FileFilter()).search_archives:
+        return list(iter_archive_entries(path, file_filter))
+    return [ManifestEntry(path, os.path.getsize(path))]
+
+
+def _run_scan(scan, entry, opener):
+    """Call scan(entry, binary_file) and return (result, error) instead of raising."""
+    try:
+        with opener() as binary_file:
+            return scan(entry, binary_file), None
+    except Exception as e:
+        return None, e
+
+
+def _scan_parallel(entries, scan, should_stop, max_workers):
+    """Scan random-access archive members on a thread pool, yielding in input order.
+
+    At most 2 * max_workers members are in flight, so only a bounded number of
+    finished results wait in memory for the consumer.
+    """
+    def task(entry):
+        return _run_scan(scan, entry, lambda: open_member(entry.path, entry.member))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        remaining = iter(entries)
+        pending = deque((entry, pool.submit(task, entry))
+                        for entry in itertools.islice(remaining, max_workers * 2))
+        while pending:
+            entry, future = pending.popleft()
+            if should_stop():
+                for _, queued in pending:
+                    queued.cancel()
+                return
+            result, error = future.result()
+            yield entry, result, error
+            for next_entry in itertools.islice(remaining, 1):
+                pending.append((next_entry, pool.submit(task, next_entry)))
+
+
+def scan_manifest(manifest, scan, should_stop=None, max_workers=ARCHIVE_WORKERS):
+    """Run scan(entry, binary_file) over every manifest entry.
+
+    Yields (entry, result, error) in manifest order; error is the exception
+    raised while opening or scanning that entry, if any. Plain files are read
+    one by one, zip members in parallel on max_workers extra threads (one by
+    one on the calling thread if max_workers is 1) and tar members in a
+    single pass over the archive stream.
+    """
+    should_stop = should_stop or (lambda: False)
+    groups = itertools.groupby(manifest, key=lambda entry: entry.path if entry.member is not None else None)
+    for archive_path, group in groups:
+        if should_stop():
+            return
+        if archive_path is None:
+            for entry in group:
+                if should_stop():
+                    return
+                result, error = _run_scan(scan, entry, lambda: open(entry.path, "rb"))
+                yield entry, result, error
+        elif supports_random_access(archive_path) and max_workers <= 1:
+            for entry in group:
+                if should_stop():
+                    return
+                result, error = _run_scan(scan, entry, lambda: open_member(entry.path, entry.member))
+                yield entry, result, error
+        elif supports_random_access(archive_path):
+            yield from _scan_parallel(list(group), scan, should_stop, max_workers)
+        else:
+            entries = {entry.member: entry for entry in group}
+            unscanned = dict(entries)
+            error = None
+            try:
+                for name, stream in iter_member_streams(archive_path, list(entries)):
+                    if should_stop():
+                        return
+                    result, scan_error = _run_scan(scan, entries[name], lambda: stream)
+                    unscanned.pop(name, None)
+                    yield entries[name], result, scan_error
+            except ARCHIVE_ERRORS as e:
+                error = e
+            # One item per manifest entry, even when the archive broke off: callers count them
+            for entry in unscanned.values():
+                yield entry, None, error or KeyError(f"{entry.member} not found in {archive_path}")
+
+
+def decode_line(raw_line):
+    """Decode one raw line like open(..., encoding='utf-8', errors='ignore') does, newline normalized to '\\n'."""
+    text = raw_line.decode("utf-8", "ignore")
+    if text.endswith("\r\n"):
+        return text[:-2] + "\n"
+    if text.endswith("\r"):
+        return text[:-1] + "\n"
+    return text
+
+
+# A lone CR followed by bytes that decode to nothing and then LF: text mode sees CRLF there
+_CR_INVALID_LF = re.compile(rb"\r[^\r\n]+\n")
+
+
+def split_raw_lines(data, final=True):
+    """Split raw bytes into lines exactly where text-mode reading would.
+
+    bytes.splitlines() already splits on LF, CRLF and lone CR. Text mode
+    decodes first, so two undecodable-byte cases differ: a lone CR followed by
+    invalid bytes and LF forms a single CRLF, and a final line made only of
+    invalid bytes disappears (only at the end of the file, so not when final
+    is False).
+    """
+    lines = data.splitlines(keepends=True)
+    if b"\r" in data and _CR_INVALID_LF.search(data):
+        merged = []
+        for raw in lines:
+            if (merged and merged[-1].endswith(b"\r") and raw.endswith(b"\n") and not raw.endswith(b"\r\n")
+                    and raw.decode("utf-8", "ignore") == "\n"):
+                merged[-1] += raw
+            else:
+                merged.append(raw)
+        lines = merged
+    if final and lines and not lines[-1].endswith((b"\n", b"\r")) and not lines[-1].decode("utf-8", "ignore"):
+        lines.pop()
+    return lines
+
+
+def _split_long_line(raw_line, max_line_bytes):
+    """A raw line cut into pieces of at most max_line_bytes, not inside a UTF-8 character or a CRLF."""
+    pieces = []
+    while len(raw_line) > max_line_bytes:
+        cut = max_line_bytes
+        while cut > max_line_bytes - 3 and (raw_line[cut] & 0xC0 == 0x80 or raw_line[cut - 1:cut + 1] == b"\r\n"):
+            cut -= 1
+        pieces.append(raw_line[:cut])
+        raw_line = raw_line[cut:]
+    pieces.append(raw_line)
+    return pieces
+
+
+def iter_line_chunks(binary_file, buffer_size=READ_BUFFER_SIZE, max_line_bytes=MAX_LINE_BYTES):
+    """Read a binary stream buffer_size bytes at a time and yield lists of its raw lines.
+
+    Concatenated, the lists equal split_raw_lines(binary_file.read()), but
+    only about one buffer is held in memory (plus any single longer line).
+    A line longer than max_line_bytes is handed out in pieces of about that
+    size, each counted as a line, so files without line breaks cannot fill
+    the memory.
+    """
+    carry = b""
+    waiting = [] # Buffers without a line break since the last split
+    waiting_bytes = 0
+    while True:
+        chunk = binary_file.read(buffer_size)
+        if not chunk:
+            break
+        if b"\n" not in chunk and b"\r" not in chunk:
+            # Only extends the last line: split once a buffer ends it, not the growing line on every read
+            waiting.append(chunk)
+            waiting_bytes += len(chunk)
+            if len(carry) + waiting_bytes <= max_line_bytes:
+                continue
+            chunk = b""
+        if waiting:
+            chunk = b"".join([carry] + waiting + [chunk])
+            carry = b""
+            waiting = []
+            waiting_bytes = 0
+        size = len(carry) + len(chunk)
+        lines = split_raw_lines(carry + chunk, final=False)
+        # The last line may go on in the next buffer (or its CR become a CRLF); a lone
+        # CR before it can still merge with it into a CRLF, so that line waits as well
+        held = 2 if len(lines) > 1 and lines[-2].endswith(b"\r") else 1
+        held_lines = lines[-held:]
+        del lines[-held:]
+        if size > max_line_bytes: # Only then can a line be too long
+            lines = [piece for raw in lines for piece in _split_long_line(raw, max_line_bytes)]
+            if len(held_lines[-1]) > max_line_bytes:
+                # The finished pieces of the last line go out, and a line waiting before it goes too
+                *pieces, rest = _split_long_line(held_lines[-1], max_line_bytes)
+                lines += [piece for raw in held_lines[:-1] for piece in _split_long_line(raw, max_line_bytes)] + pieces
+                held_lines = [rest]
+        carry = b"".join(held_lines)
+        if lines:
+            yield lines
+    carry = b"".join([carry] + waiting)
+    lines = split_raw_lines(carry)
+    if len(carry) > max_line_bytes:
+        lines = [piece for raw in lines for piece in _split_long_line(raw, max_line_bytes)]
+    if lines:
+        yield lines
+
+
+# Compact per-file scan result, produced on worker threads and appended to a MatchTable in order.
+# lines holds the decoded text of the records for immediate display and is not kept by the table.
+FileMatches = namedtuple("FileMatches", "line_nos offsets lengths hit_flags lines")
+
+
+def empty_file_matches():
+    return FileMatches(array("I"), array("Q"), array("I"), bytearray(), [])
+
+
+class ContextCollector:
+    """Builds one file's FileMatches while its lines stream past in chunks.
+
+    Only lines that may still be needed as leading context are held back
+    (at most 2 * CONTEXT_LINES), so memory does not grow with the file.
+    Each hit gets CONTEXT_LINES lines before and after it; blocks that overlap
+    or are separated by at most CONTEXT_LINES lines are merged into one.
+    Once more than max_lines lines would be kept, the kept lines are dropped
+    and hits are only counted from then on. drain() hands out finished blocks
+    while the file is still being read.
+    """
+
+    def __init__(self, max_lines=None):
+        self.matches = empty_file_matches()
+        self.hits = 0
+        self.max_lines = max_lines
+        self.count_only = max_lines is not None and max_lines <= 0
+        self._next_idx = 0 # Index of the first line of the next chunk
+        self._next_offset = 0
+        self._held = [] # Raw lines just before the next chunk that were not kept
+        self._kept_upto = -1 # Index of the last kept line
+        self._block_end = None # Last line index of the current block's trailing context
+        self._block_pos = 0 # Position in matches of the current block's first line
+
+    def add_chunk(self, raw_lines, hits):
+        """Feed the next raw lines of the file; hits are sorted positions within raw_lines."""
+        self.hits += len(hits)
+        if self.count_only:
+            return
+        held = self._held
+        lines = held + raw_lines if held else raw_lines
+        first = self._next_idx - len(held)
+        starts = list(itertools.accumulate(map(len, lines), initial=self._next_offset - sum(map(len, held))))
+        self._next_idx = first + len(lines)
+        self._next_offset = starts[-1]
+        hit_set = {first + len(held) + pos for pos in hits}
+
+        def keep_through(end):
+            for idx in range(self._kept_upto + 1, end + 1):
+                raw = lines[idx - first]
+                self.matches.line_nos.append(idx + 1)
+                self.matches.offsets.append(starts[idx - first])
+                self.matches.lengths.append(len(raw))
+                self.matches.hit_flags.append(idx in hit_set)
+                self.matches.lines.append(decode_line(raw))
+            self._kept_upto = max(self._kept_upto, end)
+
+        for pos in hits:
+            idx = first + len(held) + pos
+            start = max(0, idx - CONTEXT_LINES)
+            if self._block_end is not None:
+                keep_through(min(self._block_end, idx - 1)) # Rest of the previous block's trailing context
+                if start > self._block_end + CONTEXT_LINES:
+                    self._kept_upto = start - 1 # New block; lines in between are skipped
+                    self._block_pos = len(self.matches.line_nos)
+            else:
+                self._kept_upto = start - 1
+                self._block_pos = len(self.matches.line_nos)
+            keep_through(idx)
+            self._block_end = idx + CONTEXT_LINES
+        last_idx = first + len(lines) - 1
+        if self._block_end is not None:
+            keep_through(min(self._block_end, last_idx))
+        self._held = lines[max(self._kept_upto + 1 - first, len(lines) - 2 * CONTEXT_LINES):]
+        if self.max_lines is not None and len(self.matches.line_nos) > self.max_lines:
+            self.count_only = True
+            self.matches = self._held = None
+
+    def skip_to(self, line_idx, offset):
+        """Continue with the line at line_idx (at byte offset) instead of the next one.
+
+        The lines skipped must hold no hits and be more than 2 * CONTEXT_LINES
+        lines away from any hit, so no block needs them.
+        """
+        self._next_idx = line_idx
+        self._next_offset = offset
+        self._kept_upto = max(self._kept_upto, line_idx - 1)
+        self._held = [] if self._held is not None else None
+
+    def result(self):
+        """FileMatches, or the number of hit lines if the collector only counted."""
+        return self.hits if self.count_only else self.matches
+
+    def drain(self, final=False, max_block_lines=None):
+        """Take the finished blocks out of the collected matches and return them as FileMatches.
+
+        A block is finished once no later hit can extend it; with final (the
+        whole file has been added) every block is. An unfinished block longer
+        than max_block_lines is handed out as far as it goes, and continues
+        as a new block. max_lines then only limits the lines not drained yet.
+        """
+        if self.count_only:
+            return empty_file_matches()
+        matches = self.matches
+        if final or self._block_end is None or self._next_idx > self._block_end + 2 * CONTEXT_LINES:
+            split = len(matches.line_nos)
+        elif max_block_lines is not None and len(matches.line_nos) - self._block_pos > max_block_lines:
+            split = len(matches.line_nos)
+        else:
+            split = self._block_pos
+        if not split:
+            return empty_file_matches()
+        self.matches = FileMatches(matches.line_nos[split:], matches.offsets[split:], matches.lengths[split:],
+                                   matches.hit_flags[split:], matches.lines[split:])
+        self._block_pos = max(0, self._block_pos - split)
+        return FileMatches(matches.line_nos[:split], matches.offsets[:split], matches.lengths[:split],
+                           matches.hit_flags[:split], matches.lines[:split])
+
+
+def scan_matches(binary_file, keyword, max_lines=None):
+    """Search one binary stream for keyword and return its context blocks as FileMatches.
+
+    Lines are split like text-mode reading does (\\n, \\r\\n and lone \\r)
+    so line numbers and blocks are identical to the app's original search
+    (see search_harness.py). The file is read READ_BUFFER_SIZE bytes at a
+    time. If the result would need more than max_lines lines, only the
+    number of hit lines is returned.
+    """
+    keyword = keyword.lower()
+    collector = ContextCollector(max_lines)
+    for raw_lines in iter_line_chunks(binary_file):
+        collector.add_chunk(raw_lines, [pos for pos, raw in enumerate(raw_lines) if keyword in decode_line(raw).lower()])
+    return collector.result()
+
+
+def scan_matches_multi(binary_file, keywords, max_lines=None):
+    """Search one binary stream for several keywords in a single pass.
+
+    Each line is decoded and lowercased once and then tested against every
+    keyword. Returns one FileMatches (or hit count, see scan_matches) per
+    keyword, in the same order.
+    """
+    keywords = [keyword.lower() for keyword in keywords]
+    collectors = [ContextCollector(max_lines) for _ in keywords]
+    for raw_lines in iter_line_chunks(binary_file):
+        hits = [[] for _ in keywords]
+        for pos, raw in enumerate(raw_lines):
+            line = decode_line(raw).lower()
+            for keyword_hits, keyword in zip(hits, keywords):
+                if keyword in line:
+                    keyword_hits.append(pos)
+        for collector, keyword_hits in zip(collectors, hits):
+            collector.add_chunk(raw_lines, keyword_hits)
+    return [collector.result() for collector in collectors]
+
+
+def hit_spans(line, terms):
+    """Column ranges (start, end) where any of terms occurs in line, case insensitive.
+
+    Sorted, with overlapping ranges merged. Columns count characters of line,
+    like text widget indices do.
+    """
+    lowered = line.lower()
+    if len(lowered) != len(line): # Rare characters change length when lowercased; search the original
+        matches = [match.span() for term in terms if term
+                   for match in re.finditer(re.escape(term), line, re.IGNORECASE)]
+    else:
+        matches = []
+        for term in terms:
+            term = term.lower()
+            if not term:
+                continue
+            start = lowered.find(term)
+            while start != -1:
+                matches.append((start, start + len(term)))
+                start = lowered.find(term, start + 1)
+    spans = []
+    for start, end in sorted(matches):
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+        else:
+            spans.append((start, end))
+    return spans
+
+
+def format_block(label, first_line_no, lines):
+    """Display text of one context block, in the format results have always used."""
+    parts = [f"\n--- {label} (Context around line {first_line_no}) ---\n"]
+    parts.extend(f"{line_no}: {line}" for line_no, line in enumerate(lines, first_line_no))
+    parts.append("---\n")
+    return "".join(parts)
+
+
+class MatchTable:
+    """Search results stored column-wise in arrays.
+
+    A result line costs about 21 bytes here, instead of a formatted string
+    plus a closure per line. Text is not stored: it is read back from the
+    file when a record is displayed again or exported.
+    """
+
+    def __init__(self):
+        self.files = [] # ManifestEntry per file id
+        self.file_ids = array("I")
+        self.line_nos = array("I")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.hit_flags = bytearray()
+        self.hit_count = 0
+
+    def __len__(self):
+        return len(self.line_nos)
+
+    def add_file(self, entry, matches):
+        """Append one file's FileMatches; returns the (start, stop) record index range."""
+        start = len(self)
+        if not matches.line_nos:
+            return start, start
+        file_id = len(self.files)
+        self.files.append(entry)
+        self.file_ids.extend(itertools.repeat(file_id, len(matches.line_nos)))
+        self.line_nos.extend(matches.line_nos)
+        self.offsets.extend(matches.offsets)
+        self.lengths.extend(matches.lengths)
+        self.hit_flags.extend(matches.hit_flags)
+        self.hit_count += sum(matches.hit_flags)
+        return start, len(self)
+
+    def iter_blocks(self, start=0, stop=None):
+        """Yield (start, stop) record ranges of each context block (consecutive lines of one file)."""
+        stop = len(self) if stop is None else stop
+        block_start = start
+        for index in range(start + 1, stop):
+            if (self.file_ids[index] != self.file_ids[index - 1]
+                    or self.line_nos[index] != self.line_nos[index - 1] + 1):
+                yield block_start, index
+                block_start = index
+        if block_start < stop:
+            yield block_start, stop
+
+    def read_lines(self, start, stop):
+        """Fetch the decoded text of records start..stop-1 from their files."""
+        lines = []
+        for file_id, group in itertools.groupby(range(start, stop), key=lambda index: self.file_ids[index]):
+            entry = self.files[file_id]
+            indices = list(group)
+            if entry.member is None:
+                with open(entry.path, "rb") as f:
+                    for index in indices:
+                        f.seek(self.offsets[index])
+                        lines.append(decode_line(f.read(self.lengths[index])))
+            else:
+                data = _read_member(entry)
+                lines.extend(decode_line(data[self.offsets[index]:self.offsets[index] + self.lengths[index]])
+                             for index in indices)
+        return lines
+
+    def format_blocks(self, start=0, stop=None, lines=None):
+        """Display text for records start..stop-1; lines are read from disk unless given."""
+        stop = len(self) if stop is None else stop
+        if lines is None:
+            lines = self.read_lines(start, stop)
+        return "".join(
+            format_block(self.files[self.file_ids[a]].label, self.line_nos[a], lines[a - start:b - start])
+            for a, b in self.iter_blocks(start, stop))
+
+    def write_text(self, out):
+        """Write the display text of every record to the text file out.
+
+        Lines are read back from the files a batch of whole blocks at a time,
+        so exporting does not need the text of all results in memory.
+        """
+        end = len(self)
+        batch_start = 0
+        for _, stop in self.iter_blocks(0, end):
+            if stop - batch_start >= EXPORT_BATCH_LINES:
+                out.write(self.format_blocks(batch_start, stop))
+                batch_start = stop
+        if batch_start < end:
+            out.write(self.format_blocks(batch_start, end))
+
+
+def _read_member(entry):
+    """Whole content of an archive member (used when re-reading results)."""
+    if supports_random_access(entry.path):
+        with open_member(entry.path, entry.member) as stream:
+            return stream.read()
+    for _, stream in iter_member_streams(entry.path, [entry.member]):
+        return stream.read()
+    return b""
@@ -0,0 +1,611 @@
+"""Precomputed per-file indexes, built in the background for watched folders.
+
+An index records, for one version of a file (path, size and modification
+time) or of a file inside an archive:
+- line-offset checkpoints: the line number and byte offset where each read
+  buffer of the file starts, so a reader can start in the middle of a file
+  with correct line numbers;
+- the file's tokens (runs of word characters, lower case), so a search can
+  tell without reading the file that a keyword cannot occur in it;
+- one Bloom filter per read buffer of the trigrams of its tokens, so a search
+  for a rare term reads only the few blocks that may contain it (plus the
+  lines around them it needs as context).
+
+Indexes live in INDEX_DIR, one file per log file or archive member. A stale
+index (the file changed since) is never used; the watcher simply builds a
+new one.
+
+Run headless with:
+    python log_index.py FOLDER [FOLDER ...] [--interval 30] [--rate-mb 8]
+"""
+import argparse
+import copy
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+from log_archive import ARCHIVE_ERRORS, is_archive, iter_member_streams, list_members
+from log_engine import (CONTEXT_LINES, READ_BUFFER_SIZE, ContextCollector, FileFilter, decode_line, empty_file_matches,
+                        iter_line_chunks, iter_log_files, scan_matches)
+
+INDEX_DIR = os.path.join(os.path.expanduser("~"), ".search_log", "index")
+WATCH_FILE = os.path.join(os.path.expanduser("~"), ".search_log", "watch.json")
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+MAX_TOKENS = 500000 # Distinct tokens per file before its token index is given up (ids, hashes, ...)
+INDEX_BYTES_PER_SEC = 8 * 1024 * 1024 # Read rate of the background indexer
+WATCH_INTERVAL = 30 # Seconds between scans of the watched folders
+SETTLE_SECONDS = 5 # Files written to more recently than this are left for the next round
+CACHE_BYTES = 64 * 1024 * 1024 # Loaded indexes kept in memory, by their estimated size
+INDEX_OVERHEAD_BYTES = 512 # Rough fixed cost of one loaded index (objects, header values)
+GRAM_LENGTH = 3 # Bloom filters hold the trigrams of tokens, so keywords can start or end mid-token
+BLOOM_BITS_PER_GRAM = 8
+BLOOM_MIN_BITS = 1024
+BLOOM_MAX_BITS = 1 << 20 # 128 KB per 1 MB block at most; fuller filters just skip less
+BLOOM_HASHES = 3
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _grams(tokens):
+    """UTF-8 trigrams of tokens (tokens shorter than GRAM_LENGTH have none)."""
+    return {token[i:i + GRAM_LENGTH].encode("utf-8")
+            for token in tokens for i in range(len(token) - GRAM_LENGTH + 1)}
+
+
+def keyword_grams(keyword):
+    """Trigrams every line containing keyword (case insensitive) has inside its tokens.
+
+    Each run of word characters in the keyword lies inside a token of such a
+    line. Keywords without a run of GRAM_LENGTH word characters give none.
+    """
+    return sorted(_grams(_TOKEN.findall(keyword.lower())))
+
+
+class BloomFilter:
+    """Set of byte strings that answers 'maybe' or 'definitely not'; the size is a power of two bits."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits):
+        self.bits = bits
+
+    @classmethod
+    def from_items(cls, items):
+        num_bits = BLOOM_MIN_BITS
+        while num_bits < len(items) * BLOOM_BITS_PER_GRAM and num_bits < BLOOM_MAX_BITS:
+            num_bits *= 2
+        bloom = cls(bytearray(num_bits // 8))
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item, digest_size=8).digest()
+        h1, h2 = int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:], "little") | 1
+        mask = len(self.bits) * 8 - 1
+        return [(h1 + i * h2) & mask for i in range(BLOOM_HASHES)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+def _path_key(path):
+    """path spelled one way for every way of naming the same file (relative, differently cased on Windows)."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _header_matches(header, path, member):
+    """Whether a stored index header is a current-version index of path (or its member)."""
+    return (isinstance(header, dict) and header.get("version") == INDEX_VERSION
+            and isinstance(header.get("path"), str) and _path_key(header["path"]) == _path_key(path)
+            and header.get("member") == member)
+
+
+def _lower_text(raw_lines):
+    """Decoded, lower-cased text of raw lines, lowered line by line like the search does."""
+    text = b"".join(raw_lines).decode("utf-8", "ignore")
+    if "Σ" in text: # Final-sigma lowering depends on the next character; keep line boundaries exact
+        return "".join(decode_line(raw).lower() for raw in raw_lines)
+    return text.lower()
+
+
+class FileIndex:
+    """Index of one version of one file, or of one archive member (size and mtime are the archive's)."""
+
+    __slots__ = ("path", "member", "size", "mtime_ns", "line_count", "block_lines", "block_offsets", "tokens",
+                 "blooms")
+
+    def __init__(self, path, size, mtime_ns, member=None):
+        self.path = path
+        self.member = member
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.line_count = 0
+        self.block_lines = array("Q") # Index of the first line of each read buffer
+        self.block_offsets = array("Q") # and its byte offset
+        self.tokens = "" # All distinct tokens joined by newlines; None if there were too many to keep
+        self.blooms = [] # BloomFilter of each block's token trigrams; None if not known
+
+    def matches_stat(self, stat_result):
+        return stat_result.st_size == self.size and stat_result.st_mtime_ns == self.mtime_ns
+
+    def memory_size(self):
+        """Estimated bytes this index takes while loaded: mostly its tokens and Bloom filters."""
+        return (INDEX_OVERHEAD_BYTES + len(self.tokens or "") + sum(len(bloom.bits) for bloom in self.blooms or ())
+                + len(self.block_lines) * 16)
+
+    def may_contain(self, keyword):
+        """False only if keyword (case insensitive) cannot occur in the file.
+
+        Every run of word characters in the keyword has to lie inside a token
+        of the file, so it must be a substring of one; the tokens are kept as
+        one newline-joined string, which makes that a single substring search.
+        """
+        if self.tokens is not None and not all(run in self.tokens for run in _TOKEN.findall(keyword.lower())):
+            return False
+        return self.blooms is None or bool(self.candidate_blocks(keyword))
+
+    def candidate_blocks(self, keyword):
+        """Indices of the blocks whose Bloom filter does not rule keyword out (all blocks if unknown)."""
+        grams = keyword_grams(keyword)
+        if not grams or self.blooms is None:
+            return list(range(len(self.block_lines)))
+        return [idx for idx, bloom in enumerate(self.blooms) if all(gram in bloom for gram in grams)]
+
+    def _block_end_line(self, idx):
+        return self.block_lines[idx + 1] if idx + 1 < len(self.block_lines) else self.line_count
+
+    def read_regions(self, keyword):
+        """Byte ranges of the file a search for keyword has to read, as (first line index, start, end).
+
+        Each candidate block is widened by whole blocks until 2 * CONTEXT_LINES
+        lines before and after it are included: a hit needs CONTEXT_LINES
+        lines around it, and two hits up to 3 * CONTEXT_LINES lines apart
+        share one block that includes every line between them. So whatever
+        lies between two regions is never shown and context blocks come out
+        exactly as a full read makes them.
+        """
+        regions = []
+        last = len(self.block_lines) - 1
+        for idx in self.candidate_blocks(keyword):
+            lo, hi = idx, idx
+            while lo > 0 and self.block_lines[idx] - self.block_lines[lo] < 2 * CONTEXT_LINES:
+                lo -= 1
+            while hi < last and self._block_end_line(hi) - self._block_end_line(idx) < 2 * CONTEXT_LINES:
+                hi += 1
+            if regions and lo <= regions[-1][1] + 1:
+                regions[-1][1] = max(regions[-1][1], hi)
+            else:
+                regions.append([lo, hi])
+        return [(self.block_lines[lo], self.block_offsets[lo],
+                 self.block_offsets[hi + 1] if hi < last else self.size) for lo, hi in regions]
+
+
+def _index_stream(index, stream, throttle=None, should_stop=None, buffer_size=READ_BUFFER_SIZE):
+    """Fill index from a binary stream, one block per buffer_size bytes; False if indexing was stopped."""
+    tokens = set()
+    offset = 0
+    for raw_lines in iter_line_chunks(stream, buffer_size):
+        if should_stop is not None and should_stop():
+            return False
+        index.block_lines.append(index.line_count)
+        index.block_offsets.append(offset)
+        index.line_count += len(raw_lines)
+        num_bytes = sum(map(len, raw_lines))
+        offset += num_bytes
+        block_tokens = set(_TOKEN.findall(_lower_text(raw_lines)))
+        index.blooms.append(BloomFilter.from_items(_grams(block_tokens)))
+        if tokens is not None:
+            tokens.update(block_tokens)
+            if len(tokens) > MAX_TOKENS:
+                tokens = None
+        if throttle is not None:
+            throttle(num_bytes)
+    index.tokens = "\n".join(sorted(tokens)) if tokens is not None else None
+    return True
+
+
+def build_index(path, throttle=None, should_stop=None, buffer_size=READ_BUFFER_SIZE):
+    """Read a file once and index it; None if it changed while being read or indexing was stopped.
+
+    throttle(num_bytes) is called after every read buffer and may sleep.
+    """
+    stat_result = os.stat(path)
+    index = FileIndex(path, stat_result.st_size, stat_result.st_mtime_ns)
+    with open(path, "rb") as f:
+        if not _index_stream(index, f, throttle, should_stop, buffer_size):
+            return None
+    if not index.matches_stat(os.stat(path)):
+        return None # Still being written; the next round picks it up
+    return index
+
+
+def build_member_indexes(archive_path, members, throttle=None, should_stop=None):
+    """Index members of an archive in one pass over it; yields a FileIndex per member.
+
+    The indexes carry the archive's size and mtime from before the pass, so
+    if the archive changes meanwhile they are simply never used.
+    """
+    stat_result = os.stat(archive_path)
+    for name, stream in iter_member_streams(archive_path, members):
+        index = FileIndex(archive_path, stat_result.st_size, stat_result.st_mtime_ns, name)
+        if not _index_stream(index, stream, throttle, should_stop):
+            return
+        yield index
+
+
+def archive_marker(archive_path, stat_result):
+    """Index saved for an archive itself once all its members are indexed.
+
+    It knows nothing about the content, so it never lets a search skip anything.
+    """
+    index = FileIndex(archive_path, stat_result.st_size, stat_result.st_mtime_ns)
+    index.tokens = index.blooms = None
+    return index
+
+
+class _Region(io.RawIOBase):
+    """The length bytes of a binary file from its current position on."""
+
+    def __init__(self, binary_file, length):
+        self.binary_file = binary_file
+        self.left = length
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.left if size is None or size < 0 else min(size, self.left)
+        data = self.binary_file.read(size)
+        self.left -= len(data)
+        return data
+
+
+def scan_indexed(binary_file, entry, keyword, index, max_lines=None):
+    """scan_matches() for a ManifestEntry, reading only what its index says may match.
+
+    index is the entry's current FileIndex or None. Returns (FileMatches or
+    hit count, bytes not read). Files the index rules out are not read at
+    all; in plain files only the regions around candidate blocks are read
+    (archive members are decompressed front to back, so they are either
+    skipped whole or read whole).
+    """
+    if index is None:
+        return scan_matches(binary_file, keyword, max_lines), 0
+    if not index.may_contain(keyword):
+        return empty_file_matches(), entry.size
+    if entry.member is not None or index.blooms is None:
+        return scan_matches(binary_file, keyword, max_lines), 0
+    lowered = keyword.lower()
+    collector = ContextCollector(max_lines)
+    read = 0
+    for first_line, start, end in index.read_regions(keyword):
+        collector.skip_to(first_line, start)
+        binary_file.seek(start)
+        for raw_lines in iter_line_chunks(_Region(binary_file, end - start)):
+            collector.add_chunk(raw_lines, [pos for pos, raw in enumerate(raw_lines) if lowered in decode_line(raw).lower()])
+        read += end - start
+    return collector.result(), max(0, entry.size - read)
+
+
+class IndexStore:
+    """Indexes on disk, with the most recently used ones kept in memory. Safe to share between threads.
+
+    The memory cache is limited by the estimated size of the indexes in it,
+    cache_bytes, not by their number: one index of a log full of ids can
+    hold megabytes of tokens and Bloom filters.
+    """
+
+    def __init__(self, directory=INDEX_DIR, cache_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_path(self, path, member=None):
+        key = _path_key(path) + ("!/" + member if member is not None else "")
+        digest = hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, digest + INDEX_SUFFIX)
+
+    def lookup(self, path, stat_result=None, member=None):
+        """The index of path (or of member inside the archive path) if one exists for its current version, else None."""
+        try:
+            stat_result = stat_result or os.stat(path)
+        except OSError:
+            return None
+        key = (_path_key(path), member)
+        with self._lock:
+            index = self._cache.get(key)
+            if index is not None:
+                if index.matches_stat(stat_result):
+                    self._cache.move_to_end(key)
+                    return index
+                self._forget(key)
+        index = self._load(path, member)
+        if index is None or not index.matches_stat(stat_result):
+            return None
+        self._remember(index)
+        return index
+
+    def is_current(self, path, stat_result, member=None):
+        """Whether an index exists for this version of path, checked from the index header only.
+
+        Cheap enough to ask for every watched file on every pass: nothing is
+        decompressed and the memory cache is left as it is.
+        """
+        with self._lock:
+            index = self._cache.get((_path_key(path), member))
+        if index is not None and index.matches_stat(stat_result):
+            return True
+        header = self._read_header(path, member)
+        return (header is not None and header.get("size") == stat_result.st_size
+                and header.get("mtime_ns") == stat_result.st_mtime_ns)
+
+    def _read_header(self, path, member=None):
+        """The header of the stored index of path (or member), or None if there is no usable one."""
+        try:
+            with open(self._index_path(path, member), "rb") as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        return header if _header_matches(header, path, member) else None
+
+    def lookup_entry(self, entry):
+        """The current index of a ManifestEntry, or None."""
+        return self.lookup(entry.path, member=entry.member)
+
+    def rules_out(self, entry, keywords):
+        """True if entry (a ManifestEntry) has a current index saying none of keywords can occur in it."""
+        index = self.lookup_entry(entry)
+        return index is not None and not any(index.may_contain(keyword) for keyword in keywords)
+
+    def save(self, index):
+        os.makedirs(self.directory, exist_ok=True)
+        tokens_blob = zlib.compress((index.tokens or "").encode("utf-8"))
+        header = {
+            "version": INDEX_VERSION, "path": os.path.abspath(index.path), "member": index.member, "size": index.size,
+            "mtime_ns": index.mtime_ns, "line_count": index.line_count, "has_tokens": index.tokens is not None,
+            "blocks": [[line, offset] for line, offset in zip(index.block_lines, index.block_offsets)],
+            "tokens_length": len(tokens_blob),
+            # Filter sizes in bytes, one per block; the filters follow the tokens unchanged
+            "blooms": [len(bloom.bits) for bloom in index.blooms] if index.blooms is not None else None,
+        }
+        target = self._index_path(index.path, index.member)
+        temp_path = target + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            f.write(tokens_blob)
+            for bloom in index.blooms or ():
+                f.write(bloom.bits)
+        os.replace(temp_path, target)
+        self._remember(index)
+
+    def _load(self, path, member=None):
+        try:
+            with open(self._index_path(path, member), "rb") as f:
+                header = json.loads(f.readline())
+                blob = f.read()
+            if not _header_matches(header, path, member):
+                return None
+            index = FileIndex(path, header["size"], header["mtime_ns"], member)
+            index.line_count = header["line_count"]
+            for line, offset in header["blocks"]:
+                index.block_lines.append(line)
+                index.block_offsets.append(offset)
+            pos = header["tokens_length"]
+            index.tokens = zlib.decompress(blob[:pos]).decode("utf-8") if header["has_tokens"] else None
+            if header["blooms"] is None:
+                index.blooms = None
+            else:
+                for num_bytes in header["blooms"]:
+                    index.blooms.append(BloomFilter(blob[pos:pos + num_bytes]))
+                    pos += num_bytes
+                if pos != len(blob) or len(index.blooms) != len(index.block_lines):
+                    return None
+            return index
+        except (OSError, ValueError, KeyError, TypeError, zlib.error):
+            return None
+
+    def set_cache_bytes(self, cache_bytes):
+        with self._lock:
+            self.cache_bytes = cache_bytes
+            self._trim()
+
+    def _remember(self, index):
+        key = (_path_key(index.path), index.member)
+        with self._lock:
+            self._forget(key)
+            if index.memory_size() > self.cache_bytes:
+                return
+            self._cache[key] = index
+            self.cached_bytes += index.memory_size()
+            self._trim()
+
+    def _forget(self, key):
+        """Drop key from the cache (lock held)."""
+        index = self._cache.pop(key, None)
+        if index is not None:
+            self.cached_bytes -= index.memory_size()
+
+    def _trim(self):
+        """Evict the least recently used indexes until the cache fits cache_bytes (lock held)."""
+        while self.cached_bytes > self.cache_bytes and self._cache:
+            _, index = self._cache.popitem(last=False)
+            self.cached_bytes -= index.memory_size()
+
+    def prune(self):
+        """Delete indexes whose file no longer exists."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(INDEX_SUFFIX)]
+        except OSError:
+            return
+        for name in names:
+            index_path = os.path.join(self.directory, name)
+            try:
+                with open(index_path, "rb") as f:
+                    path = json.loads(f.readline()).get("path")
+                if not path or not os.path.exists(path):
+                    os.remove(index_path)
+            except (OSError, ValueError, AttributeError):
+                continue
+
+
+class IndexWatcher(threading.Thread):
+    """Background thread that keeps indexes of the files in some folders up to date.
+
+    Every interval seconds the folders are walked and new, rotated or
+    changed files (once they stopped changing) are indexed, newest first.
+    Archives are indexed member by member in one pass each.
+    Reading is throttled to bytes_per_sec and pauses completely while
+    is_busy() is true, so interactive searches keep the disk to themselves.
+    """
+
+    def __init__(self, store, folders, file_filter=None, is_busy=None, interval=WATCH_INTERVAL,
+                 bytes_per_sec=INDEX_BYTES_PER_SEC):
+        super().__init__(name="log-indexer", daemon=True)
+        self.store = store
+        self.folders = list(folders)
+        self.file_filter = file_filter or FileFilter()
+        self.is_busy = is_busy or (lambda: False)
+        self.interval = interval
+        self.bytes_per_sec = bytes_per_sec
+        self.indexed_files = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.index_pending()
+            self.store.prune()
+            self._stop_event.wait(self.interval)
+
+    def _iter_archives(self, folder):
+        """Archives under folder that the filter lets a search look into."""
+        if not self.file_filter.search_archives:
+            return
+        for dir_path, dir_names, file_names in os.walk(folder):
+            rel_dir = os.path.relpath(dir_path, folder).replace(os.sep, "/")
+            rel_dir = "" if rel_dir == "." else rel_dir + "/"
+            depth = rel_dir.count("/")
+            dir_names[:] = sorted(name for name in dir_names
+                                  if self.file_filter.accepts_dir(rel_dir + name, depth + 1))
+            for name in sorted(file_names):
+                if not is_archive(name):
+                    continue
+                try:
+                    if self.file_filter.accepts_archive(rel_dir + name, os.stat(os.path.join(dir_path, name))):
+                        yield os.path.join(dir_path, name)
+                except OSError:
+                    continue
+
+    def pending(self):
+        """Plain files and archives in the watched folders without a current index, newest first."""
+        now = time.time()
+        candidates = []
+        plain_filter = copy.copy(self.file_filter) # Archives are found separately, without listing their members
+        plain_filter.search_archives = False
+        for folder in self.folders:
+            paths = [entry.path for entry in iter_log_files(folder, plain_filter)]
+            for path in paths + list(self._iter_archives(folder)):
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat_result.st_mtime < SETTLE_SECONDS:
+                    continue
+                self._wait_while_busy()
+                if self._stop_event.is_set():
+                    return []
+                if not self.store.is_current(path, stat_result):
+                    candidates.append((stat_result.st_mtime, path))
+        return [path for _, path in sorted(candidates, reverse=True)]
+
+    def index_pending(self):
+        for path in self.pending():
+            if self._stop_event.is_set():
+                return
+            try:
+                if is_archive(path):
+                    self._index_archive(path)
+                    continue
+                index = build_index(path, self._throttle, self._stop_event.is_set)
+            except ARCHIVE_ERRORS:
+                continue
+            if index is not None:
+                self.store.save(index)
+                self.indexed_files += 1
+
+    def _index_archive(self, archive_path):
+        stat_result = os.stat(archive_path)
+        members = [name for name, size in list_members(archive_path)
+                   if self.file_filter.accepts_member(name, size)]
+        done = 0
+        for index in build_member_indexes(archive_path, members, self._throttle, self._stop_event.is_set):
+            self.store.save(index)
+            self.indexed_files += 1
+            done += 1
+        if done == len(members):
+            self.store.save(archive_marker(archive_path, stat_result))
+
+    def _throttle(self, num_bytes):
+        self._stop_event.wait(num_bytes / self.bytes_per_sec)
+        self._wait_while_busy()
+
+    def _wait_while_busy(self):
+        while self.is_busy() and not self._stop_event.is_set():
+            self._stop_event.wait(0.5)
+
+
+def load_watch_folders(path=WATCH_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            folders = json.load(f).get("folders", [])
+    except (OSError, ValueError, AttributeError):
+        return []
+    return [folder for folder in folders if isinstance(folder, str)]
+
+
+def save_watch_folders(folders, path=WATCH_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"folders": list(folders)}, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index log folders in the background so searches can skip files.")
+    parser.add_argument("folders", nargs="*", help="folders to watch (default: the app's watch list)")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between folder scans")
+    parser.add_argument("--rate-mb", type=float, default=INDEX_BYTES_PER_SEC / (1024 * 1024), help="read rate limit in MB/s")
+    args = parser.parse_args(argv)
+    folders = args.folders or load_watch_folders()
+    if not folders:
+        parser.error("no folders given and none configured in the app")
+
+    watcher = IndexWatcher(IndexStore(), folders, interval=args.interval,
+                           bytes_per_sec=args.rate_mb * 1024 * 1024)
+    print(f"Indexing {', '.join(folders)} every {args.interval:g}s", flush=True)
+    watcher.start()
+    try:
+        while watcher.is_alive():
+            watcher.join(1)
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Structured log lines: pluggable line parsers and field-scoped queries.
+
+A query such as `level=ERROR tag:ActivityManager status>=500` is a list of
+terms that must all match. Field terms look at the fields a parser pulled out
+of the line (JSON lines, logfmt, Android logcat); bare words are plain
+case-insensitive substrings of the line, like a normal keyword search. Lines
+that no parser understands, and lines without the term's field, fall back to
+a substring match of the term text, so `userId=12345` still finds that text
+in a plain message. Quoting a whole term ("userId=12345") makes it a plain
+word, and URLs (http://host:8080) are never field terms.
+
+Before a line is decoded and parsed, a cheap substring test on its raw bytes
+throws away lines that cannot possibly match.
+"""
+import json
+import os
+import re
+import shlex
+
+from log_engine import ContextCollector, decode_line, iter_line_chunks, scan_matches_multi
+
+DETECT_SAMPLE_LINES = 20 # Non-blank lines looked at to pick a parser for a file
+
+_LOGCAT_LEVELS = {"V": "VERBOSE", "D": "DEBUG", "I": "INFO", "W": "WARN", "E": "ERROR", "F": "FATAL", "A": "ASSERT"}
+
+# threadtime: 05-01 12:34:56.789  1234  5678 E ActivityManager: message
+_LOGCAT_THREADTIME = re.compile(
+    r"^(\d\d-\d\d) (\d\d:\d\d:\d\d\.\d+)\s+(\d+)\s+(\d+)\s+([VDIWEFA])\s+(.*?)\s*: (.*)$")
+# brief: E/ActivityManager( 1234): message
+_LOGCAT_BRIEF = re.compile(r"^([VDIWEFA])/(.*?)\(\s*(\d+)\): (.*)$")
+
+_LOGFMT_PAIR = re.compile(r'([A-Za-z_][\w.\-]*)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+
+# field, operator, value; longer operators first so 'a>=1' is not read as 'a>' '=1'
+_FIELD_TERM = re.compile(r"^([A-Za-z_][\w.@\-]*)(!=|>=|<=|=|:|>|<)(.+)$", re.S)
+
+# Query terms as typed, to tell which ones were quoted as a whole
+_QUERY_TOKEN = re.compile(r"""(?:[^\s"']|"[^"]*"|'[^']*')+""")
+
+# Values that look the same in every supported format (no JSON escaping, no logfmt quoting needed).
+# ASCII only: JSON may store 'café' as 'caf\u00e9', which a UTF-8 needle would miss.
+_VERBATIM_VALUE = re.compile(r"^[\w.@\-]+$", re.ASCII)
+
+
+class JsonLineParser:
+    """One JSON object per line. Nested objects are flattened to dotted names (http.status)."""
+
+    name = "json"
+    keyed = True # Field names appear in the raw line
+    derived_fields = frozenset()
+
+    def detect(self, line):
+        return line.lstrip().startswith("{") and self.parse(line) is not None
+
+    def parse(self, line):
+        line = line.strip()
+        if not line.startswith("{"):
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        fields = {}
+        self._flatten(record, "", fields)
+        return fields
+
+    def _flatten(self, record, prefix, fields):
+        for key, value in record.items():
+            name = prefix + str(key).lower()
+            if isinstance(value, dict):
+                self._flatten(value, name + ".", fields)
+            elif isinstance(value, str):
+                fields[name] = value
+            else:
+                fields[name] = json.dumps(value) # true/false/null, numbers, lists as written in JSON
+
+
+class LogfmtParser:
+    """key=value pairs, values optionally double-quoted (level=info msg="request done" status=200)."""
+
+    name = "logfmt"
+    keyed = True
+    derived_fields = frozenset()
+
+    def detect(self, line):
+        return len(_LOGFMT_PAIR.findall(line)) >= 2
+
+    def parse(self, line):
+        fields = {}
+        for key, value in _LOGFMT_PAIR.findall(line):
+            if value.startswith('"'):
+                value = re.sub(r"\\(.)", r"\1", value[1:-1])
+            fields[key.lower()] = value
+        return fields or None
+
+
+class LogcatParser:
+    """Android logcat in threadtime (the default of `adb logcat`) or brief format.
+
+    Fields: date, time, pid, tid, priority (the letter), level (ERROR, WARN, ...),
+    tag and message.
+    """
+
+    name = "logcat"
+    keyed = False # Fields are positional, their names never appear in the line
+    derived_fields = frozenset(("level",))
+
+    def detect(self, line):
+        return self.parse(line) is not None
+
+    def parse(self, line):
+        line = line.rstrip("\r\n")
+        match = _LOGCAT_THREADTIME.match(line)
+        if match:
+            date, time, pid, tid, priority, tag, message = match.groups()
+            return {"date": date, "time": time, "pid": pid, "tid": tid, "priority": priority,
+                    "level": _LOGCAT_LEVELS[priority], "tag": tag, "message": message}
+        match = _LOGCAT_BRIEF.match(line)
+        if match:
+            priority, tag, pid, message = match.groups()
+            return {"pid": pid, "priority": priority, "level": _LOGCAT_LEVELS[priority],
+                    "tag": tag.strip(), "message": message}
+        return None
+
+
+# Parsers by name, tried in this order when a file's format is detected
+PARSERS = {parser.name: parser for parser in (JsonLineParser(), LogcatParser(), LogfmtParser())}
+
+
+def register_parser(parser):
+    """Add (or replace) a line parser.
+
+    A parser has a name, keyed (whether field names appear in raw lines),
+    derived_fields (fields whose values are not copied verbatim from the
+    line), detect(line) and parse(line) returning a dict of lower-case field
+    names to string values, or None for lines it does not understand.
+    """
+    PARSERS[parser.name] = parser
+
+
+def detect_parser(label, lines):
+    """Pick the parser for a file from its name and first non-blank lines; None for plain text."""
+    base = os.path.basename(label.rsplit("!/", 1)[-1]).lower()
+    if base.startswith("logcat") or base.endswith(".logcat"):
+        return PARSERS.get("logcat")
+    sample = []
+    for line in lines:
+        if line.strip():
+            sample.append(line)
+            if len(sample) == DETECT_SAMPLE_LINES:
+                break
+    if not sample:
+        return None
+    for parser in PARSERS.values():
+        if sum(1 for line in sample if parser.detect(line)) * 2 > len(sample):
+            return parser
+    return None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FieldTerm:
+    """One field condition, e.g. level=ERROR, tag:Activity or status>=500."""
+
+    __slots__ = ("field", "op", "value", "text", "_number")
+
+    def __init__(self, field, op, value, text):
+        self.field = field.lower()
+        self.op = op
+        self.value = value.lower()
+        self.text = text.lower() # Whole term, for lines that could not be parsed
+        self._number = _number(value)
+
+    def matches(self, fields):
+        actual = fields.get(self.field)
+        if actual is None:
+            return self.op == "!="
+        if self.op == ":":
+            return self.value in actual.lower()
+        if self.op in ("=", "!="):
+            number = _number(actual)
+            if number is not None and self._number is not None:
+                equal = number == self._number
+            else:
+                equal = actual.lower() == self.value
+            return equal == (self.op == "=")
+        number = _number(actual)
+        if number is None or self._number is None:
+            return False
+        if self.op == ">":
+            return number > self._number
+        if self.op == ">=":
+            return number >= self._number
+        if self.op == "<":
+            return number < self._number
+        return number <= self._number
+
+    def needles(self, parser):
+        """Lower-case byte strings every raw line matching this term must contain."""
+        needles = []
+        # Lines without the field satisfy !=, so only the other operators need its name
+        if parser is not None and parser.keyed and self.op != "!=" and self.field.isascii(): # Same JSON escaping as values
+            needles.append(self.field.rsplit(".", 1)[-1].encode("utf-8"))
+        if (self.op in ("=", ":") and self._number is None and _VERBATIM_VALUE.match(self.value)
+                and (parser is None or self.field not in parser.derived_fields)):
+            needles.append(self.value.encode("utf-8"))
+        return needles
+
+
+class FieldQuery:
+    """All terms of a query; a line matches when every term does."""
+
+    def __init__(self, terms, words):
+        self.terms = terms
+        self.words = words # Bare words, lower case
+
+    def matches(self, line, fields):
+        lowered = line.lower()
+        if any(word not in lowered for word in self.words):
+            return False
+        if fields is None:
+            return all(term.text in lowered for term in self.terms)
+        # A field the line does not have is searched as text (except for !=, which it satisfies)
+        return all(term.matches(fields) if term.field in fields or term.op == "!=" else term.text in lowered
+                   for term in self.terms)
+
+    def highlight_terms(self):
+        """Text worth highlighting in matching lines: bare words and the values of = and : terms."""
+        return self.words + [term.value for term in self.terms if term.op in ("=", ":")]
+
+    def needles(self, parser):
+        needles = [word.encode("utf-8") for word in self.words]
+        for term in self.terms:
+            needles.extend(term.needles(parser))
+        return needles
+
+
+def parse_query(text):
+    """FieldQuery for a query with at least one field term, or None for a plain keyword.
+
+    Terms are separated by spaces; quote a value to keep spaces in it
+    (msg:"connection refused"), or a whole term to search it as plain text.
+    """
+    try:
+        tokens = shlex.split(text)
+    except ValueError: # Unbalanced quotes: not a field query
+        return None
+    quoted = [raw[0] in "\"'" for raw in _QUERY_TOKEN.findall(text)]
+    if len(quoted) != len(tokens): # Escapes shlex reads differently; no term counts as quoted
+        quoted = [False] * len(tokens)
+    terms, words = [], []
+    for token, is_quoted in zip(tokens, quoted):
+        match = None if is_quoted else _FIELD_TERM.match(token)
+        if match and match.group(2) == ":" and match.group(3).startswith("//"):
+            match = None # scheme://host, not a field
+        if match:
+            terms.append(FieldTerm(*match.groups(), token))
+        elif token:
+            words.append(token.lower())
+    if not terms:
+        return None
+    return FieldQuery(terms, words)
+
+
+def query_line_test(query, label="", first_lines=(), parser=None):
+    """Function of one raw line returning its decoded text if it matches query, else None.
+
+    The parser is detected from the label and first_lines (decoded lines of
+    the file) unless given. A cheap substring test on the raw bytes throws
+    away most lines before they are decoded and parsed.
+    """
+    if parser is None:
+        parser = detect_parser(label, first_lines)
+    needles = query.needles(parser)
+
+    def test(raw):
+        # bytes.lower() only folds ASCII, so lines with other bytes skip the prefilter
+        if needles and raw.isascii():
+            lowered = raw.lower()
+            if any(needle not in lowered for needle in needles):
+                return None
+        line = decode_line(raw)
+        return line if query.matches(line, parser.parse(line) if parser is not None else None) else None
+    return test
+
+
+def scan_structured(binary_file, query, label="", parser=None, max_lines=None):
+    """Search one binary stream for a FieldQuery and return its context blocks as FileMatches.
+
+    The parser is detected from the label and the first lines unless given.
+    Lines are split, numbered and buffered exactly like scan_matches() does,
+    and like there, only the number of hit lines is returned if the result
+    would need more than max_lines lines.
+    """
+    collector = ContextCollector(max_lines)
+    test = None
+    for raw_lines in iter_line_chunks(binary_file):
+        if test is None:
+            test = query_line_test(query, label, (decode_line(raw) for raw in raw_lines), parser)
+        collector.add_chunk(raw_lines, [pos for pos, raw in enumerate(raw_lines) if test(raw) is not None])
+    return collector.result()
+
+
+def scan_queries(binary_file, queries, label="", max_lines=None):
+    """Search one binary stream for several queries, plain keywords or field queries, in a single pass.
+
+    Returns one FileMatches (or hit count, see scan_matches) per query, in
+    the same order, like scan_matches_multi(), which does the work when no
+    query has field terms.
+    """
+    parsed = [parse_query(query) for query in queries]
+    if all(query is None for query in parsed):
+        return scan_matches_multi(binary_file, queries, max_lines)
+    keywords = [query.lower() for query in queries]
+    collectors = [ContextCollector(max_lines) for _ in queries]
+    tests = None
+    for raw_lines in iter_line_chunks(binary_file):
+        if tests is None:
+            parser = detect_parser(label, (decode_line(raw) for raw in raw_lines))
+            tests = [query_line_test(query, label, parser=parser) if query is not None else None for query in parsed]
+        hits = [[] for _ in queries]
+        for pos, raw in enumerate(raw_lines):
+            line = decode_line(raw).lower()
+            for query_hits, keyword, test in zip(hits, keywords, tests):
+                if (keyword in line) if test is None else (test(raw) is not None):
+                    query_hits.append(pos)
+        for collector, query_hits in zip(collectors, hits):
+            collector.add_chunk(raw_lines, query_hits)
+    return [collector.result() for collector in collectors]
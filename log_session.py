@@ -0,0 +1,257 @@
+"""Search sessions on disk: checkpoints of a running search that can be resumed or reopened.
+
+A session file holds the search (keyword and path), its manifest, how far
+the scan got and the compact result records found so far. A finished
+session reopens without searching again: the records only point into the
+files, so only the displayed lines are read.
+
+Progress is checkpointed per manifest entry, not per byte offset: after a
+crash or an early exit the search continues with the first file (or
+archive member) that was not finished, which is searched again from its
+start. Members of compressed archives cannot be entered at an offset
+anyway, and a file's blocks and line numbers depend on everything before
+them in it.
+
+File layout: a one-line JSON header (cheap to list), a one-line JSON
+manifest, then one JSON line per checkpoint with the result records found
+since the previous one. The manifest is written once; a checkpoint appends
+its records and then rewrites the header in place (it is padded to a fixed
+length). The header's record counts say how much of the file is valid, so a
+crash in the middle of a checkpoint leaves the previous one.
+"""
+import base64
+import json
+import os
+import time
+from array import array
+from datetime import datetime
+
+from log_engine import ManifestEntry, MatchTable
+
+SESSION_DIR = os.path.join(os.path.expanduser("~"), ".search_log", "sessions")
+SESSION_SUFFIX = ".session"
+SESSION_VERSION = 2
+HEADER_SLACK = 256 # Room left in the header line for its values to grow
+CHECKPOINT_INTERVAL = 5.0 # Seconds between checkpoints of a running search
+MAX_SESSIONS = 20 # Older session files are deleted when a new search starts
+
+
+def _encode_column(column):
+    return base64.b64encode(column.tobytes() if isinstance(column, array) else bytes(column)).decode("ascii")
+
+
+def _decode_column(typecode, text):
+    data = base64.b64decode(text)
+    if typecode is None:
+        return bytearray(data)
+    column = array(typecode)
+    column.frombytes(data)
+    return column
+
+
+class SearchSession:
+    """One search and its progress; the results table is filled in by the search."""
+
+    def __init__(self, keyword, path, manifest, collapse=False, session_id=None, directory=SESSION_DIR):
+        self.id = session_id or datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.keyword = keyword
+        self.path = path
+        self.manifest = list(manifest)
+        self.collapse = collapse
+        self.directory = directory
+        self.status = "running" # running (or crashed), cancelled, failed, complete
+        self.files_done = 0 # Manifest entries fully searched; a resumed search starts after them (from byte 0)
+        self.bytes_done = 0
+        self.results = MatchTable()
+        self.updated = None
+        self._saved_at = 0.0
+        self._header_bytes = None # Length of the header line on disk; None until the file exists
+        self._saved_records = 0 # Records and files of results already on disk
+        self._saved_files = 0
+
+    @property
+    def file_path(self):
+        return os.path.join(self.directory, self.id + SESSION_SUFFIX)
+
+    @property
+    def total_bytes(self):
+        return sum(entry.size for entry in self.manifest)
+
+    @property
+    def resumable(self):
+        return self.status != "complete" and self.files_done < len(self.manifest)
+
+    def remaining(self):
+        """Manifest entries still to be searched."""
+        return self.manifest[self.files_done:]
+
+    def advance(self, entry):
+        """Record that entry (the next one in the manifest) has been searched and its results added."""
+        self.files_done += 1
+        self.bytes_done += entry.size
+
+    def checkpoint(self):
+        """Save if the last save is older than CHECKPOINT_INTERVAL; cheap to call after every file."""
+        if time.monotonic() - self._saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def finish(self, status):
+        self.status = status
+        self.save()
+
+    def header(self):
+        return {
+            "version": SESSION_VERSION, "id": self.id, "keyword": self.keyword, "path": self.path,
+            "collapse": self.collapse, "status": self.status, "updated": self.updated,
+            "files_done": self.files_done, "total_files": len(self.manifest),
+            "bytes_done": self.bytes_done, "total_bytes": self.total_bytes,
+            "hits": self.results.hit_count, "lines": len(self.results), "result_files": len(self.results.files),
+        }
+
+    def _header_line(self, length=None):
+        """Header as one line padded to length bytes; None if it no longer fits"""
+        text = json.dumps(self.header()) # ASCII only, so characters are bytes
+        length = length or len(text) + HEADER_SLACK + 1
+        if len(text) + 1 > length:
+            return None
+        return (text.ljust(length - 1) + "\n").encode("ascii")
+
+    def save(self):
+        """Checkpoint: append the records found since the last save, then update the header."""
+        self.updated = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self._header_bytes is None:
+            self._create()
+        else:
+            table = self.results
+            records = len(table)
+            files = len(table.files)
+            with open(self.file_path, "r+b") as f:
+                if records > self._saved_records:
+                    f.seek(0, os.SEEK_END)
+                    f.write(self._records_line(self._saved_records, records, self._saved_files, files))
+                    f.flush()
+                header = self._header_line(self._header_bytes)
+                if header is not None:
+                    f.seek(0)
+                    f.write(header)
+            if header is None: # Grown past its slack (rare): write the whole file anew
+                self._create()
+            self._saved_records, self._saved_files = records, files
+        self._saved_at = time.monotonic()
+
+    def _create(self):
+        """Write the whole file: header, manifest and all records so far (atomically)."""
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.file_path):
+            prune_sessions(self.directory, keep=MAX_SESSIONS - 1)
+        table = self.results
+        records = len(table)
+        files = len(table.files)
+        header = self._header_line()
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            f.write(json.dumps([list(entry) for entry in self.manifest]).encode("utf-8") + b"\n")
+            if records:
+                f.write(self._records_line(0, records, 0, files))
+        os.replace(temp_path, self.file_path)
+        self._header_bytes = len(header)
+        self._saved_records, self._saved_files = records, files
+
+    def _records_line(self, start, stop, first_file, end_file):
+        """Result records start..stop-1 and files first_file..end_file-1 as one JSON line"""
+        table = self.results
+        return json.dumps({
+            "files": [list(entry) for entry in table.files[first_file:end_file]],
+            "file_ids": _encode_column(table.file_ids[start:stop]),
+            "line_nos": _encode_column(table.line_nos[start:stop]),
+            "offsets": _encode_column(table.offsets[start:stop]),
+            "lengths": _encode_column(table.lengths[start:stop]),
+            "hit_flags": _encode_column(table.hit_flags[start:stop]),
+        }).encode("utf-8") + b"\n"
+
+    @classmethod
+    def load(cls, file_path):
+        """Read a session file written by save(); raises ValueError if it is not one."""
+        with open(file_path, "rb") as f:
+            header_line = f.readline()
+            header = json.loads(header_line)
+            if header.get("version") != SESSION_VERSION:
+                raise ValueError(f"unsupported session file version: {header.get('version')}")
+            manifest = [ManifestEntry(*entry) for entry in json.loads(f.readline())]
+            session = cls(header["keyword"], header["path"], manifest, header["collapse"], header["id"],
+                          os.path.dirname(file_path))
+            session.status = header["status"]
+            session.files_done = header["files_done"]
+            session.bytes_done = header["bytes_done"]
+            session.updated = header["updated"]
+            table = session.results
+            clean = True # Nothing on disk past what the header counts
+            for line in f:
+                try:
+                    records = json.loads(line)
+                except ValueError: # Cut off by a crash mid-checkpoint; the header does not count it
+                    clean = False
+                    break
+                table.files.extend(ManifestEntry(*entry) for entry in records["files"])
+                table.file_ids.extend(_decode_column("I", records["file_ids"]))
+                table.line_nos.extend(_decode_column("I", records["line_nos"]))
+                table.offsets.extend(_decode_column("Q", records["offsets"]))
+                table.lengths.extend(_decode_column("I", records["lengths"]))
+                table.hit_flags.extend(_decode_column(None, records["hit_flags"]))
+        # Records appended after the header was last updated belong to no checkpoint
+        count, files = header["lines"], header["result_files"]
+        if len(table.files) < files or not (len(table.file_ids) == len(table.offsets) == len(table.lengths)
+                                             == len(table) == len(table.hit_flags) >= count):
+            raise ValueError("corrupt session file: fewer result records than its header lists")
+        clean = clean and len(table) == count and len(table.files) == files
+        del table.files[files:], table.file_ids[count:], table.line_nos[count:], table.offsets[count:]
+        del table.lengths[count:], table.hit_flags[count:]
+        table.hit_count = sum(table.hit_flags)
+        # Appending after leftovers of a crashed checkpoint would mix them in; the next save rewrites the file then
+        session._header_bytes = len(header_line) if clean else None
+        session._saved_records, session._saved_files = count, files
+        return session
+
+
+def list_sessions(directory=SESSION_DIR):
+    """Headers of the saved sessions, newest first; each has its file path under 'file'."""
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(SESSION_SUFFIX)]
+    except OSError:
+        return []
+    sessions = []
+    for name in names:
+        file_path = os.path.join(directory, name)
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            continue
+        if isinstance(header, dict) and header.get("version") == SESSION_VERSION:
+            header["file"] = file_path
+            sessions.append(header)
+    sessions.sort(key=lambda header: header.get("updated") or "", reverse=True)
+    return sessions
+
+
+def prune_sessions(directory=SESSION_DIR, keep=MAX_SESSIONS):
+    """Delete all but the keep newest session files."""
+    for header in list_sessions(directory)[keep:]:
+        delete_session(header["file"])
+
+
+def delete_session(file_path):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def describe_session(header):
+    """One-line summary of a session header for lists."""
+    status = "interrupted" if header["status"] == "running" else header["status"] # Saved mid-search, app gone since
+    progress = (f"{header['files_done']}/{header['total_files']} files" if status != "complete"
+                else f"{header['total_files']} files")
+    return (f"{header['updated']}  [{status}]  \"{header['keyword']}\" in {header['path']}  "
+            f"({progress}, {header['hits']} hits)")
@@ -0,0 +1,311 @@
+"""Streaming aggregates over search hits: statistics and collapsing of repeated blocks.
+
+Lines are looked at one by one while the file is read and only counters
+(hits per minute, per masked line) and hashes are kept, never the lines
+themselves or one value per hit.
+"""
+import calendar
+import hashlib
+import heapq
+import re
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+
+from log_engine import decode_line, iter_line_chunks
+from log_parsers import query_line_test
+
+TOP_LINES = 15 # Most frequent (masked) matching lines shown in the report
+TOP_FILES = 20
+LINE_COUNTER_CAPACITY = 2000 # Distinct masked lines tracked per file before the rarest are dropped
+MAX_TIME_BINS = 2000 # Histogram bins; the bin width grows beyond one minute for long time spans
+SPARKLINE_WIDTH = 80
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+_numpy = None # Optional, for vectorized time binning: the module once imported, False if not installed
+
+_MONTHS = {name: idx for idx, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+
+# ISO-8601 style: 2024-05-01 12:34:56(.789) or 2024-05-01T12:34:56,789
+_ISO_TS = re.compile(r"(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:[.,](\d{1,6}))?")
+# Android logcat threadtime: 05-01 12:34:56.789
+_LOGCAT_TS = re.compile(r"^(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?")
+# Syslog: May  1 12:34:56
+_SYSLOG_TS = re.compile(r"^([A-Za-z]{3}) +(\d{1,2}) (\d\d):(\d\d):(\d\d)")
+
+# Volatile parts of a line, masked so repeated messages compare equal
+_MASK_PATTERN = re.compile(
+    r"\d{4}-\d\d-\d\d[T ]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d:?\d\d)?"  # timestamps
+    r"|\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"  # UUIDs
+    r"|\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{6,}\b"  # hex
+    r"|\d+")  # numbers
+
+
+def parse_timestamp(line, default_year=None):
+    """Epoch seconds (UTC-naive) of the timestamp in a log line, or None.
+
+    Understands ISO-8601 style anywhere in the line and logcat/syslog style
+    at the start. Formats without a year use default_year (the current year
+    if not given).
+    """
+    try:
+        match = _ISO_TS.search(line)
+        if match:
+            year, month, day, hour, minute, second, fraction = match.groups()
+        else:
+            match = _LOGCAT_TS.match(line)
+            if match:
+                month, day, hour, minute, second, fraction = match.groups()
+            else:
+                match = _SYSLOG_TS.match(line)
+                if not match:
+                    return None
+                month_name, day, hour, minute, second = match.groups()
+                month = _MONTHS.get(month_name.lower())
+                if month is None:
+                    return None
+                fraction = None
+            year = default_year or datetime.now().year
+        seconds = calendar.timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+    except ValueError:
+        return None
+    if fraction:
+        seconds += int(fraction) / 10 ** len(fraction)
+    return seconds
+
+
+def mask_line(line):
+    """Replace timestamps, ids, hex and numbers with '#' so similar lines compare equal."""
+    return _MASK_PATTERN.sub("#", line.strip())
+
+
+def _prune(counter, capacity):
+    """Keep the capacity most frequent keys once the counter has grown to twice that."""
+    if len(counter) > 2 * capacity:
+        kept = counter.most_common(capacity)
+        counter.clear()
+        counter.update(dict(kept))
+
+
+class FileStats:
+    """Aggregates for one file; built on a worker thread, merged into KeywordStats in order."""
+
+    __slots__ = ("hits", "minute_hits", "untimed_hits", "line_counts")
+
+    def __init__(self):
+        self.hits = 0
+        self.minute_hits = Counter() # Epoch minute (seconds // 60) -> hits with a timestamp in it
+        self.untimed_hits = 0
+        self.line_counts = Counter()
+
+
+def _keyword_line_test(keyword):
+    keyword = keyword.lower()
+
+    def test(raw):
+        line = decode_line(raw)
+        return line if keyword in line.lower() else None
+    return test
+
+
+def scan_stats(binary_file, keyword, default_year=None, query=None, label=""):
+    """Stream one binary file and aggregate the lines containing keyword (case insensitive).
+
+    Given a FieldQuery (parsed from keyword), the lines matching it are
+    aggregated instead, exactly the lines a search for it lists as hits.
+    """
+    stats = FileStats()
+    test = None
+    for raw_lines in iter_line_chunks(binary_file):
+        if test is None:
+            test = (_keyword_line_test(keyword) if query is None
+                    else query_line_test(query, label, (decode_line(raw) for raw in raw_lines)))
+        minutes = []
+        for raw in raw_lines:
+            line = test(raw)
+            if line is None:
+                continue
+            stats.hits += 1
+            timestamp = parse_timestamp(line, default_year)
+            if timestamp is None:
+                stats.untimed_hits += 1
+            else:
+                minutes.append(int(timestamp // 60))
+            stats.line_counts[mask_line(line)] += 1
+            _prune(stats.line_counts, LINE_COUNTER_CAPACITY)
+        stats.minute_hits.update(minutes) # Binned per chunk; nothing per hit outlives the chunk
+    return stats
+
+
+def _load_numpy():
+    """NumPy, imported on first use so it does not slow down app start; None if not installed."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def bin_timestamps(minute_hits, max_bins=MAX_TIME_BINS):
+    """Histogram of {epoch minute: hits} in one-minute bins (wider when the span needs more than max_bins).
+
+    Returns (start epoch seconds, bin width in seconds, list of counts). Uses
+    numpy.bincount when NumPy is installed.
+    """
+    if not minute_hits:
+        return 0, 60, []
+    first = min(minute_hits)
+    span = max(minute_hits) - first + 1
+    step = max(1, -(-span // max_bins)) # Minutes per bin
+    np = _load_numpy()
+    if np is not None:
+        minutes = np.fromiter(minute_hits.keys(), dtype=np.int64, count=len(minute_hits))
+        hits = np.fromiter(minute_hits.values(), dtype=np.int64, count=len(minute_hits))
+        counts = np.bincount((minutes - first) // step, weights=hits).astype(np.int64).tolist()
+    else:
+        counts = [0] * ((span - 1) // step + 1)
+        for minute, hits in minute_hits.items():
+            counts[(minute - first) // step] += hits
+    return first * 60, step * 60, counts
+
+
+def sparkline(counts, width=SPARKLINE_WIDTH):
+    """Render counts as a one-line bar chart, summing neighbouring bins down to width characters."""
+    if not counts:
+        return ""
+    if len(counts) > width:
+        step = -(-len(counts) // width)
+        counts = [sum(counts[i:i + step]) for i in range(0, len(counts), step)]
+    peak = max(counts) or 1
+    # Rounded up, so any hit shows and the peak gets the full bar
+    return "".join(" " if not c else SPARK_CHARS[(c * (len(SPARK_CHARS) - 1) + peak - 1) // peak] for c in counts)
+
+
+class KeywordStats:
+    """Aggregate statistics of one keyword over a whole search."""
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+        self.files_searched = 0
+        self.hits = 0
+        self.untimed_hits = 0
+        self.hits_per_file = Counter()
+        self.minute_hits = Counter()
+        self.line_counts = Counter()
+
+    def add(self, label, file_stats):
+        self.files_searched += 1
+        if not file_stats.hits:
+            return
+        self.hits += file_stats.hits
+        self.untimed_hits += file_stats.untimed_hits
+        self.hits_per_file[label] += file_stats.hits
+        self.minute_hits.update(file_stats.minute_hits)
+        self.line_counts.update(file_stats.line_counts)
+        _prune(self.line_counts, LINE_COUNTER_CAPACITY)
+
+    def report(self):
+        """Summary as plain text: totals, hits per file, time histogram and top lines."""
+        out = [f"===== Statistics for \"{self.keyword}\" =====",
+               f"Files searched: {self.files_searched}   Files with hits: {len(self.hits_per_file)}   "
+               f"Hits: {self.hits}   Hits without timestamp: {self.untimed_hits}", ""]
+        if not self.hits:
+            out.append("No matches found.")
+            return "\n".join(out) + "\n"
+
+        out.append(f"Hits per file (top {TOP_FILES}):")
+        for label, count in self.hits_per_file.most_common(TOP_FILES):
+            out.append(f"{count:>10}  {label}")
+        out.append("")
+
+        if self.minute_hits:
+            first, width, counts = bin_timestamps(self.minute_hits)
+            fmt = lambda seconds: datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%d %H:%M")
+            out.append(f"Hits over time ({width // 60} min per bin, {fmt(first)} to {fmt(first + width * len(counts))}):")
+            out.append("  " + sparkline(counts))
+            out.append("  Busiest bins:")
+            busiest = sorted(range(len(counts)), key=lambda i: counts[i], reverse=True)[:10]
+            for idx in sorted(busiest):
+                if counts[idx]:
+                    out.append(f"{counts[idx]:>10}  {fmt(first + idx * width)}")
+            out.append("")
+
+        out.append(f"Most frequent matching lines (numbers masked, top {TOP_LINES}):")
+        for line, count in self.line_counts.most_common(TOP_LINES):
+            out.append(f"{count:>10}  {line}")
+        return "\n".join(out) + "\n"
+
+
+COLLAPSE_CAPACITY = 10000 # Distinct block signatures remembered while collapsing
+
+
+class CollapsedGroup:
+    """Repeated context blocks that share one normalized signature."""
+
+    __slots__ = ("group_id", "count", "first_seen", "last_seen")
+
+    def __init__(self, group_id, seen):
+        self.group_id = group_id
+        self.count = 1
+        self.first_seen = seen # (file label, line number)
+        self.last_seen = seen
+
+    def summary(self):
+        (first_label, first_line), (last_label, last_line) = self.first_seen, self.last_seen
+        return (f"[×{self.count} occurrences, first seen {first_label} line {first_line}, "
+                f"last seen {last_label} line {last_line}]\n")
+
+
+class BlockCollapser:
+    """Detects repeated context blocks (retry storms and the like) while results stream in.
+
+    A block's signature is a 64-bit hash of its lines with timestamps, ids,
+    hex and numbers masked out, so only hashes are kept, never text. At most
+    capacity signatures are remembered (least recently seen are forgotten
+    first), plus at most capacity forgotten groups that did repeat (the most
+    repeated; the others are only counted in dropped_groups), which keeps
+    memory bounded on any input.
+    """
+
+    def __init__(self, capacity=COLLAPSE_CAPACITY):
+        self.capacity = capacity
+        self._groups = OrderedDict()
+        self._evicted = [] # Heap of (count, group_id, group): the most repeated forgotten groups, for their summaries
+        self.dropped_groups = 0 # Forgotten repeated groups beyond that, without a summary
+        self._next_id = 0
+        self.collapsed_blocks = 0
+
+    def add(self, lines, label, line_no):
+        """Register a block; returns (group, is_new). Only new blocks need to be displayed."""
+        digest = hashlib.blake2b(digest_size=8)
+        for line in lines:
+            digest.update(mask_line(line).encode("utf-8", "ignore"))
+            digest.update(b"\n")
+        key = digest.digest()
+        group = self._groups.get(key)
+        if group is not None:
+            group.count += 1
+            group.last_seen = (label, line_no)
+            self._groups.move_to_end(key)
+            self.collapsed_blocks += 1
+            return group, False
+        group = self._groups[key] = CollapsedGroup(self._next_id, (label, line_no))
+        self._next_id += 1
+        if len(self._groups) > self.capacity:
+            _, oldest = self._groups.popitem(last=False)
+            if oldest.count > 1:
+                item = (oldest.count, oldest.group_id, oldest)
+                if len(self._evicted) < self.capacity:
+                    heapq.heappush(self._evicted, item)
+                else:
+                    heapq.heappushpop(self._evicted, item)
+                    self.dropped_groups += 1
+        return group, True
+
+    def repeated_groups(self):
+        """Groups seen more than once, in order of first appearance (without the dropped ones)."""
+        groups = [group for _, _, group in self._evicted] + [group for group in self._groups.values() if group.count > 1]
+        return sorted(groups, key=lambda group: group.group_id)
@@ -0,0 +1,191 @@
+"""Timeline view: the matches of many files merged into one chronological stream.
+
+Every file is searched as a stream that hands out its context blocks as
+soon as they are finished, each tagged with a timestamp parsed from its
+first hit line. A k-way heap merge over those streams puts the blocks of
+all files in time order. Only one small read buffer and the blocks not yet
+merged are held per file, so hundreds of large logs can be merged at once.
+At most TIMELINE_MAX_OPEN_FILES of them are open at a time (the default
+descriptor limit is 256 on macOS, 512 streams in the Windows C runtime);
+the others are reopened at the offset they got to when their turn comes.
+Plain files are closed first: seeking back into a reopened zip member
+decompresses it again from its start, so with more than
+TIMELINE_MAX_OPEN_FILES zip members read side by side the merge costs about
+the square of their size.
+
+Blocks are merged in the order their timestamps say; a file whose lines
+are out of order is not sorted internally. Blocks without a timestamp keep
+their place after the previous block of their file (before everything
+else if no block of that file had one yet).
+"""
+import heapq
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from log_archive import open_member, supports_random_access
+from log_engine import ContextCollector, FileMatches, decode_line, iter_line_chunks
+from log_stats import parse_timestamp
+
+TIMELINE_BUFFER_SIZE = 64 * 1024 # Bytes read at a time per file
+TIMELINE_MAX_OPEN_FILES = 64
+TIMELINE_MAX_BLOCK_LINES = 2000 # Longer runs of hits are handed out in pieces of about this many lines
+
+# One context block of one file: its timestamp (epoch seconds or None), the
+# ManifestEntry it came from and its lines as FileMatches, or the error
+# that ended the file's stream.
+TimelineBlock = namedtuple("TimelineBlock", "timestamp entry matches error")
+
+
+def split_blocks(matches):
+    """Split FileMatches into one FileMatches per context block (run of consecutive line numbers)."""
+    line_nos = matches.line_nos
+    start = 0
+    for index in range(1, len(line_nos) + 1):
+        if index == len(line_nos) or line_nos[index] != line_nos[index - 1] + 1:
+            yield FileMatches(line_nos[start:index], matches.offsets[start:index], matches.lengths[start:index],
+                              matches.hit_flags[start:index], matches.lines[start:index])
+            start = index
+
+
+def block_timestamp(matches, default_year=None):
+    """Timestamp of the first hit line that has one, else of any line of the block; None if no line has one."""
+    ordered = [line for line, is_hit in zip(matches.lines, matches.hit_flags) if is_hit]
+    ordered += [line for line, is_hit in zip(matches.lines, matches.hit_flags) if not is_hit]
+    for line in ordered:
+        timestamp = parse_timestamp(line, default_year)
+        if timestamp is not None:
+            return timestamp
+    return None
+
+
+def iter_file_blocks(binary_file, keyword, buffer_size=TIMELINE_BUFFER_SIZE, should_stop=None,
+                     max_block_lines=TIMELINE_MAX_BLOCK_LINES):
+    """Search one binary stream for keyword and yield its context blocks (FileMatches) in file order.
+
+    Blocks and line numbers are the ones scan_matches() finds; each block is
+    yielded as soon as no later hit can extend it. A block that grows past
+    max_block_lines is yielded in pieces, so dense hits do not pile up.
+    """
+    keyword = keyword.lower()
+    collector = ContextCollector()
+    for raw_lines in iter_line_chunks(binary_file, buffer_size):
+        if should_stop is not None and should_stop():
+            return
+        collector.add_chunk(raw_lines, [pos for pos, raw in enumerate(raw_lines) if keyword in decode_line(raw).lower()])
+        yield from split_blocks(collector.drain(max_block_lines=max_block_lines))
+    yield from split_blocks(collector.drain(final=True))
+
+
+class _FilePool:
+    """Keeps at most limit of the files read through it open, closing the least recently read.
+
+    Files that are expensive to reopen (rewinds) are only closed when no other file is open.
+    """
+
+    def __init__(self, limit=TIMELINE_MAX_OPEN_FILES):
+        self.limit = limit
+        self._open = OrderedDict() # _PooledFile -> open binary file
+
+    def read(self, pooled, size):
+        binary_file = self._open.get(pooled)
+        if binary_file is None:
+            while len(self._open) >= self.limit:
+                victim = next((other for other in self._open if not other.rewinds), None)
+                self._open.pop(victim if victim is not None else next(iter(self._open))).close()
+            binary_file = pooled.opener()
+            try:
+                if pooled.position:
+                    binary_file.seek(pooled.position)
+            except BaseException:
+                binary_file.close()
+                raise
+            self._open[pooled] = binary_file
+        else:
+            self._open.move_to_end(pooled)
+        data = binary_file.read(size)
+        pooled.position += len(data)
+        return data
+
+    def close(self, pooled):
+        binary_file = self._open.pop(pooled, None)
+        if binary_file is not None:
+            binary_file.close()
+
+
+class _PooledFile:
+    """Binary file read through a _FilePool: opened on first read, reopened at its offset when it was closed.
+
+    rewinds means reopening at the offset reads everything before it again (compressed archive members).
+    """
+
+    def __init__(self, opener, pool, rewinds=False):
+        self.opener = opener
+        self.pool = pool
+        self.rewinds = rewinds
+        self.position = 0
+
+    def read(self, size=-1):
+        return self.pool.read(self, size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.pool.close(self)
+
+
+class TimelineMerge:
+    """Iterate over the context blocks of keyword in all manifest entries, oldest first.
+
+    Yields TimelineBlock tuples. A file that cannot be read yields one block
+    with its error instead (right away, not in time order). Members of
+    archives that can only be read front to back (tar) cannot be streamed
+    side by side and are left out; they are listed in skipped_entries.
+    bytes_read counts the bytes consumed so far, for progress reports.
+    """
+
+    def __init__(self, manifest, keyword, should_stop=None, default_year=None, buffer_size=TIMELINE_BUFFER_SIZE,
+                 max_open_files=TIMELINE_MAX_OPEN_FILES):
+        self.keyword = keyword
+        self.should_stop = should_stop or (lambda: False)
+        self.default_year = default_year or datetime.now().year # One year for all files, so they compare
+        self.buffer_size = buffer_size
+        self.entries = []
+        self.skipped_entries = []
+        for entry in manifest:
+            if entry.member is None or supports_random_access(entry.path):
+                self.entries.append(entry)
+            else:
+                self.skipped_entries.append(entry)
+        self.bytes_read = 0
+        self._pool = _FilePool(max_open_files)
+
+    def _open(self, entry):
+        if entry.member is None:
+            return _PooledFile(lambda: open(entry.path, "rb"), self._pool)
+        return _PooledFile(lambda: open_member(entry.path, entry.member), self._pool, rewinds=True)
+
+    def _file_blocks(self, entry):
+        """(sort key, TimelineBlock) for one entry, in file order."""
+        last_key = float("-inf")
+        try:
+            with self._open(entry) as binary_file:
+                done = 0
+                for matches in iter_file_blocks(binary_file, self.keyword, self.buffer_size, self.should_stop):
+                    timestamp = block_timestamp(matches, self.default_year)
+                    if timestamp is not None:
+                        last_key = timestamp
+                    # Bytes up to the end of the block; the rest of the file is counted when it ends
+                    end = matches.offsets[-1] + matches.lengths[-1]
+                    self.bytes_read += max(0, end - done)
+                    done = max(done, end)
+                    yield last_key, TimelineBlock(timestamp, entry, matches, None)
+                self.bytes_read += max(0, entry.size - done)
+        except Exception as e:
+            yield float("-inf"), TimelineBlock(None, entry, None, e)
+
+    def __iter__(self):
+        streams = [self._file_blocks(entry) for entry in self.entries]
+        # heapq.merge keeps equal keys in stream (manifest) order
+        for _, block in heapq.merge(*streams, key=lambda item: item[0]):
+            yield block
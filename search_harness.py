@@ -0,0 +1,621 @@
+"""Differential check of every search path against the reference search.
+
+The reference is the way the app has always searched, written out here
+again so it shares no code with the engine: the file read in text mode
+(UTF-8, undecodable bytes ignored, universal newlines), every line tested
+with `keyword.lower() in line.lower()`, each hit widened to 5 lines either
+side and the ranges sorted and merged while the next starts at most 5 lines
+after the current one ends. Every faster path has to produce exactly the
+same blocks, line numbers, line text and hit flags, and byte offsets that
+point at those lines. That includes the corpus file read as a member of a
+zip (scanned in parallel) and of a tar.gz (streamed), from a member index,
+and with a max_lines limit, which has to give the hit count alone exactly
+when the blocks need more lines.
+
+The corpora are a fixed set of adversarial files (CRLF, lone CR, missing
+final newline, invalid UTF-8, blocks that just do or do not merge, lines
+longer than a read buffer, ...) plus random files built from the same
+kind of pieces. Short reads stand in for small read buffers, so every
+buffer boundary case is hit with small files.
+
+The HTTP search service is started on a free localhost port once per run:
+its results are compared with the reference as well, malformed requests
+have to get a 400 and a cancelled search has to stop early.
+
+Run headless with:
+    python search_harness.py [--trials 500] [--seed 1] [--save-failures DIR] [--verbose]
+
+The exit status is 1 if any path diverged from the reference.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tarfile
+import tempfile
+import zipfile
+from collections import Counter, namedtuple
+from urllib.parse import urlencode
+
+from log_archive import iter_member_streams
+from log_engine import (ManifestEntry, MatchTable, build_manifest, decode_line, empty_file_matches, scan_manifest,
+                        scan_matches, scan_matches_multi, split_raw_lines)
+from log_index import IndexStore, build_index, build_member_indexes, scan_indexed
+from log_parsers import detect_parser, parse_query, query_line_test, scan_queries, scan_structured
+from log_session import SearchSession
+from log_timeline import TimelineMerge, iter_file_blocks
+from search_server import serve
+
+SHORT_READ_SIZES = (1, 2, 3, 7, 64) # Bytes per read() for the small-buffer runs
+INDEX_BLOCK_SIZES = (16, 61, 400) # Index block sizes, small enough for several blocks per test file
+ARCHIVE_MEMBER = "logs/corpus.log" # Name of the corpus inside the test archives
+SERVER_CANCEL_FILES = 400 # Files of the search that gets cancelled: far more output than socket buffers hold
+SERVER_CANCEL_LINE = b"error " + b"x" * 2000 + b"\n"
+
+# Pieces random corpora are made of: keyword material, characters whose case
+# folding is special, every kind of line break and undecodable bytes
+PIECES = (
+    b"error", b"ERROR", b"Err", b"er", b"ror", b"level=ERR", b"ok", b"warn", b" ", b" ", b"\t", b"-", b"=",
+    b"2024-05-01 10:00:00 ", "Σ".encode(), "ς".encode(), "é".encode(), "İ".encode(),
+    b"\n", b"\n", b"\n", b"\r\n", b"\r", b"\xff", b"\xe2\x82", b"\x00", b"\x0b", b"\x0c", b"\x1c", " ".encode(),
+)
+KEYWORDS = ("error", "ERR", "err", "ror", "level=err", "σ", "İ", "ok\n", "\t", "r e")
+
+ADVERSARIAL_CASES = (
+    ("empty file", b""),
+    ("only newlines", b"\n\n\n"),
+    ("no final newline", b"a\nb\nerror"),
+    ("hit on last line without newline", b"x\n" * 8 + b"error"),
+    ("crlf", b"x\r\nerror\r\ny\r\n" * 3),
+    ("lone cr", b"a\rerror\rb\r\rc"),
+    ("cr then lf in next line", b"error\r" + b"\n" * 3),
+    ("cr, invalid bytes, lf", b"a\r\xff\nerror\n\r\xfe\xfd\nb\n"),
+    ("invalid final line", b"error\n\xff\xfe"),
+    ("invalid bytes inside keyword", b"er\xffror\nerr\xe2\x82or\n"),
+    ("truncated utf-8 at end", b"error \xe2\x82"),
+    ("nul bytes", b"\x00error\x00\n\x00\n"),
+    ("non-newline separators", "a\x0berror\x0cb\x1cc\x85d e\n".encode()),
+    ("sigma folding", "ΣΑΣ error\nΣ\nσς\n".encode()),
+    ("dotted capital i", "İstanbul error\ni̇\n".encode()),
+    ("hits on every line", b"error\n" * 40),
+    ("line longer than a buffer", b"x" * 5000 + b"error\n" + b"y" * 5000 + b"\n"),
+) + tuple(
+    # Two hits `gap` lines apart: blocks merge up to a gap of 3 * CONTEXT_LINES - 1 lines
+    (f"hits {gap} lines apart", b"line\n" * 7 + b"error\n" + b"line\n" * gap + b"error\n" + b"line\n" * 7)
+    for gap in (0, 1, 4, 5, 9, 10, 11, 14, 15, 16, 20, 21, 22)
+) + (
+    ("hit in first and last line", b"error\n" + b"line\n" * 30 + b"error"),
+)
+
+# Lines structured corpora are made of: fields present, absent, nested, differently cased,
+# non-ASCII (no raw-byte prefilter) and a few lines no parser understands
+STRUCTURED_LINES = {
+    "json": (b'{"level":"debug","msg":"start"}', b'{"msg":"nothing"}', b'{"level":"ERROR","status":500,"msg":"failed"}',
+             b'{"level":"info","http":{"status":404}}', b'{"level":"warn","status":"503"}', b'{"Level":"Debug"}',
+             '{"level":"error","user":"café"}'.encode(), b'{"user":"caf\\u00e9","status":200}',
+             b"plain text level=error"),
+    "logfmt": (b"level=debug msg=start", b"msg=nothing", b'level=error status=500 msg="request failed"',
+               b"level=info status=404", b"ts=1 level=warn", b"status=500", "level=info user=café".encode(),
+               b"no fields here"),
+}
+STRUCTURED_QUERIES = ("level!=debug", "level=error", "status>=500", "status!=500", "level!=debug msg:nothing",
+                      "http.status!=404", "level!=info failed", "user=café", "user!=café", "level=error status!=404")
+STRUCTURED_TRIALS = 20 # Random files per format
+
+Divergence = namedtuple("Divergence", "case keyword mode detail")
+
+
+class ShortReads:
+    """Binary stream wrapper whose read() returns at most limit bytes, like a tiny read buffer."""
+
+    def __init__(self, binary_file, limit):
+        self.binary_file = binary_file
+        self.limit = limit
+
+    def read(self, size=-1):
+        return self.binary_file.read(self.limit if size is None or size < 0 else min(size, self.limit))
+
+
+def reference_ranges(hit_indices, line_count):
+    """Line-index ranges (start, end inclusive) around hits: 5 lines either side, sorted and merged."""
+    ranges = sorted((max(0, idx - 5), min(line_count - 1, idx + 5)) for idx in hit_indices)
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 5:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def reference_search(path, keyword, line_test=None):
+    """(lines, merged (start, end) index ranges) of the reference search.
+
+    line_test(line) replaces the keyword test, for field queries.
+    """
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.readlines()
+    if line_test is None:
+        lowered = keyword.lower()
+        line_test = lambda line: lowered in line.lower()
+    return lines, reference_ranges([idx for idx, line in enumerate(lines) if line_test(line)], len(lines))
+
+
+def reference_records(path, keyword, line_test=None):
+    """[(line number, text, is hit, offset ok)] of the reference search."""
+    if line_test is None:
+        lowered = keyword.lower()
+        line_test = lambda line: lowered in line.lower()
+    lines, ranges = reference_search(path, keyword, line_test)
+    return [(idx + 1, lines[idx], line_test(lines[idx]), True)
+            for start, end in ranges for idx in range(start, end + 1)]
+
+
+def reference_text(path, keyword):
+    """Display text of the reference search."""
+    lines, ranges = reference_search(path, keyword)
+    parts = []
+    for start, end in ranges:
+        parts.append(f"\n--- {path} (Context around line {start + 1}) ---\n")
+        parts.extend(f"{idx + 1}: {lines[idx]}" for idx in range(start, end + 1))
+        parts.append("---\n")
+    return "".join(parts)
+
+
+def file_matches_for_hits(raw_lines, hit_indices):
+    """FileMatches of the reference blocks around hit_indices (line indices into raw_lines)."""
+    matches = empty_file_matches()
+    starts = list(itertools.accumulate((len(raw) for raw in raw_lines), initial=0))
+    hit_set = set(hit_indices)
+    for start, end in reference_ranges(hit_indices, len(raw_lines)):
+        for idx in range(start, end + 1):
+            matches.line_nos.append(idx + 1)
+            matches.offsets.append(starts[idx])
+            matches.lengths.append(len(raw_lines[idx]))
+            matches.hit_flags.append(idx in hit_set)
+            matches.lines.append(decode_line(raw_lines[idx]))
+    return matches
+
+
+def match_records(matches, data):
+    """Records of FileMatches in the reference's form; offset ok says the offsets point at the line."""
+    if isinstance(matches, int):
+        return [("hit count only", matches)]
+    return [(line_no, line, bool(is_hit), decode_line(data[offset:offset + length]) == line)
+            for line_no, line, is_hit, offset, length
+            in zip(matches.line_nos, matches.lines, matches.hit_flags, matches.offsets, matches.lengths)]
+
+
+def table_records(table):
+    """Records of a whole MatchTable, text read back from the files."""
+    lines = table.read_lines(0, len(table))
+    return [(table.line_nos[idx], lines[idx], bool(table.hit_flags[idx]), True) for idx in range(len(table))]
+
+
+def _concat(blocks):
+    records = []
+    for block in blocks:
+        records.extend(block)
+    return records
+
+
+def write_archives(data, workdir):
+    """The corpus as member ARCHIVE_MEMBER of a zip and of a tar.gz, between other members; their paths.
+
+    The member's index in each is saved to the index store in workdir.
+    """
+    members = [("first.log", b"error\n" * 3), (ARCHIVE_MEMBER, data), ("last.log", b"ok\nerror\n")]
+    zip_path = os.path.join(workdir, "corpus.zip")
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members:
+            archive.writestr(name, content)
+    tar_path = os.path.join(workdir, "corpus.tar.gz")
+    with tarfile.open(tar_path, "w:gz") as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    store = IndexStore(os.path.join(workdir, "index"))
+    for archive_path in (zip_path, tar_path):
+        for index in build_member_indexes(archive_path, [ARCHIVE_MEMBER]):
+            store.save(index)
+    return [zip_path, tar_path]
+
+
+def archive_runs(archives, data, keyword, workdir):
+    """Yield (mode name, records) for the corpus read as an archive member."""
+    store = IndexStore(os.path.join(workdir, "index"), cache_bytes=0)
+    for archive_path in archives:
+        kind = "zip member" if archive_path.endswith(".zip") else "tar.gz member"
+        how = "parallel scan" if archive_path.endswith(".zip") else "streamed scan"
+        manifest = build_manifest(archive_path)
+        entry = next((entry for entry in manifest if entry.member == ARCHIVE_MEMBER), None)
+        if entry is None:
+            yield f"{kind}, {how}", [("member not listed", [entry.member for entry in manifest])]
+            continue
+        scan = lambda _, binary_file: scan_matches(binary_file, keyword)
+        for scanned, result, error in scan_manifest(manifest, scan):
+            if scanned == entry:
+                yield f"{kind}, {how}", match_records(result, data) if error is None else [("error", repr(error))]
+        if archive_path.endswith(".zip"): # As the search service reads them, on the calling thread
+            for scanned, result, error in scan_manifest(manifest, scan, max_workers=1):
+                if scanned == entry:
+                    yield f"{kind}, serial scan", match_records(result, data) if error is None else [("error", repr(error))]
+
+        index = store.lookup(archive_path, member=ARCHIVE_MEMBER)
+        if index is None:
+            yield f"{kind}, scan_indexed", [("member index not found after save",)]
+            continue
+        for _, binary_file in iter_member_streams(archive_path, [ARCHIVE_MEMBER]):
+            yield f"{kind}, scan_indexed", match_records(scan_indexed(binary_file, entry, keyword, index)[0], data)
+
+
+def limited_runs(path, data, keyword, expected):
+    """Yield (mode name, records, expected records) for searches with a max_lines limit.
+
+    A limit the blocks just fit into lists them; one line less gives only the hit count.
+    """
+    if not expected:
+        return # Nothing to limit (and max_lines 0 always just counts)
+    hits = sum(1 for record in expected if record[2])
+    entry = ManifestEntry(path, len(data))
+    index = build_index(path, buffer_size=INDEX_BLOCK_SIZES[1])
+    for limit, max_lines, wanted in (("fits", len(expected), expected),
+                                     ("one line short", len(expected) - 1, [("hit count only", hits)])):
+        with open(path, "rb") as f:
+            yield (f"scan_matches, max_lines {limit}",
+                   match_records(scan_matches(ShortReads(f, 7), keyword, max_lines), data), wanted)
+        with open(path, "rb") as f:
+            yield (f"scan_matches_multi, max_lines {limit}",
+                   match_records(scan_matches_multi(f, [keyword], max_lines)[0], data), wanted)
+        with open(path, "rb") as f:
+            yield (f"scan_indexed, max_lines {limit}",
+                   match_records(scan_indexed(f, entry, keyword, index, max_lines)[0], data), wanted)
+
+
+def engine_runs(path, data, keyword, workdir):
+    """Yield (mode name, records) for every search path that applies to keyword."""
+    entry = ManifestEntry(path, len(data))
+    with open(path, "rb") as f:
+        yield "scan_matches", match_records(scan_matches(f, keyword), data)
+    for size in SHORT_READ_SIZES:
+        with open(path, "rb") as f:
+            yield f"scan_matches, reads of {size} B", match_records(scan_matches(ShortReads(f, size), keyword), data)
+
+    with open(path, "rb") as f:
+        results = scan_matches_multi(ShortReads(f, 5), [keyword, "\x00never\x00", keyword.upper()])
+    yield "scan_matches_multi", match_records(results[0], data)
+    if keyword.upper().lower() == keyword.lower(): # Not so for e.g. final sigma
+        yield "scan_matches_multi, upper-cased keyword", match_records(results[2], data)
+
+    raw_lines = split_raw_lines(data)
+    lowered = keyword.lower()
+    hits = [idx for idx, raw in enumerate(raw_lines) if lowered in decode_line(raw).lower()]
+    yield "split_raw_lines", match_records(file_matches_for_hits(raw_lines, hits), data)
+
+    # A field term falls back to a substring match of its text on lines no parser understands
+    query = parse_query(keyword)
+    if query is not None and len(query.terms) == 1 and not query.words and query.terms[0].text == lowered:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            plain_text = detect_parser(path, f) is None
+        if plain_text:
+            with open(path, "rb") as f:
+                yield "scan_structured, plain-text fallback", match_records(
+                    scan_structured(ShortReads(f, 7), query, path), data)
+
+    with open(path, "rb") as f:
+        yield "timeline blocks, reads of 3 B", _concat(
+            match_records(block, data) for block in iter_file_blocks(ShortReads(f, 3), keyword))
+    yield "timeline merge", _concat(
+        match_records(block.matches, data) if block.error is None else [("error", repr(block.error))]
+        for block in TimelineMerge([entry], keyword, buffer_size=11))
+
+    store = IndexStore(os.path.join(workdir, "index"))
+    for size in INDEX_BLOCK_SIZES:
+        index = build_index(path, buffer_size=size)
+        if size == INDEX_BLOCK_SIZES[0]: # One of them through the file format as well
+            store.save(index)
+            index = IndexStore(store.directory, cache_bytes=0).lookup(path)
+            if index is None:
+                yield f"scan_indexed, {size} B blocks", [("index not found after save",)]
+                continue
+        with open(path, "rb") as f:
+            matches, _ = scan_indexed(f, entry, keyword, index)
+        yield f"scan_indexed, {size} B blocks", match_records(matches, data)
+
+    session = SearchSession(keyword, path, [entry], directory=os.path.join(workdir, "sessions"))
+    with open(path, "rb") as f:
+        session.results.add_file(entry, scan_matches(f, keyword))
+    session.advance(entry)
+    session.finish("complete")
+    yield "session round trip", table_records(SearchSession.load(session.file_path).results)
+
+
+def formatted_divergence(path, keyword):
+    """Compare the display text of a search with the reference's; None if equal."""
+    expected = reference_text(path, keyword)
+    table = MatchTable()
+    with open(path, "rb") as f:
+        matches = scan_matches(f, keyword)
+    table.add_file(ManifestEntry(path, os.path.getsize(path)), matches)
+    got = table.format_blocks(lines=matches.lines)
+    if got == expected and table.format_blocks() == expected:
+        return None
+    return f"display text differs: expected {expected[:200]!r}, got {got[:200]!r}"
+
+
+def describe_difference(expected, got):
+    for idx, (want, have) in enumerate(zip(expected, got)):
+        if want != have:
+            return f"record {idx}: expected {want!r}, got {have!r}"
+    return f"{len(expected)} records expected, got {len(got)}"
+
+
+def check_case(name, data, keywords, workdir):
+    """Run every mode on one corpus file; returns (Divergence list, Counter of modes run)."""
+    path = os.path.join(workdir, "corpus.log")
+    with open(path, "wb") as f:
+        f.write(data)
+    archives = write_archives(data, workdir)
+    divergences = []
+    runs = Counter()
+    for keyword in keywords:
+        expected = reference_records(path, keyword)
+        runs_of_keyword = itertools.chain(
+            ((mode, records, expected) for mode, records in engine_runs(path, data, keyword, workdir)),
+            ((mode, records, expected) for mode, records in archive_runs(archives, data, keyword, workdir)),
+            limited_runs(path, data, keyword, expected))
+        for mode, records, wanted in runs_of_keyword:
+            runs[mode] += 1
+            if records != wanted:
+                divergences.append(Divergence(name, keyword, mode, describe_difference(wanted, records)))
+        runs["display text"] += 1
+        detail = formatted_divergence(path, keyword)
+        if detail:
+            divergences.append(Divergence(name, keyword, "display text", detail))
+    return divergences, runs
+
+
+async def _http(port, request):
+    """Send one raw request to the service; returns (status, [JSON objects of the body])."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(request)
+        head, _, body = (await reader.read()).partition(b"\r\n\r\n")
+    finally:
+        writer.close()
+    return int(head.split(b" ", 2)[1]), [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+def _get(target, **params):
+    return f"GET {target}?{urlencode(dict(params))} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode()
+
+
+def _post(target, body, length=None):
+    length = len(body) if length is None else length
+    return f"POST {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode() + body
+
+
+async def _server_checks(workdir, port):
+    """Yield (check name, problem or None) for the service listening on port."""
+    # A search, compared with the reference file by file
+    corpus = os.path.join(workdir, "served")
+    os.makedirs(corpus)
+    expected = {}
+    for name, data in ADVERSARIAL_CASES:
+        path = os.path.join(corpus, name.replace(" ", "_").replace(",", "") + ".log")
+        with open(path, "wb") as f:
+            f.write(data)
+        records = reference_records(path, "error")
+        if records:
+            expected[path] = records
+    status, messages = await _http(port, _get("/search", path=corpus, q="error"))
+    got = {}
+    for message in messages:
+        if message["type"] == "block":
+            got.setdefault(message["file"], []).extend(
+                (line["line"], line["text"], line["hit"], True) for line in message["lines"])
+    problem = None
+    if status != 200 or not messages or messages[-1]["type"] != "done":
+        problem = f"status {status}, last message {messages[-1:]!r}"
+    elif got != expected:
+        path = min(set(got) ^ set(expected) or [p for p in expected if got[p] != expected[p]])
+        problem = f"{path}: " + describe_difference(expected.get(path, []), got.get(path, []))
+    yield "search", problem
+
+    # Past max_lines files are only counted
+    status, messages = await _http(port, _get("/search", path=corpus, q="error", max_lines=0))
+    hits = sum(record[2] for records in expected.values() for record in records)
+    done = messages[-1] if messages else {}
+    counted = sum(message["hits"] for message in messages if message["type"] == "file_hits")
+    yield "max_lines", (None if status == 200 and done.get("lines") == 0 and done.get("unlisted_hits") == hits == counted
+                        else f"status {status}, {hits} hits expected, got {done!r}, {counted} in file_hits")
+
+    # Malformed requests
+    for name, request in (
+        ("non-numeric Content-Length", _post("/search", b'{"query": "x", "path": "."}', length="abc")),
+        ("negative Content-Length", _post("/search", b"", length=-1)),
+        ("body not JSON", _post("/search", b"{")),
+        ("missing query", _post("/search", json.dumps({"path": corpus}).encode())),
+        ("negative max_lines", _get("/search", path=corpus, q="error", max_lines=-1)),
+        ("invalid glob", _get("/search", path=corpus, q="error", include="[z-a]")),
+    ):
+        status, messages = await _http(port, request)
+        yield f"400 for {name}", None if status == 400 else f"status {status}, {messages[:1]!r}"
+
+    # Cancel a search whose client does not read: it has to stop well before the last file
+    corpus = os.path.join(workdir, "cancelled")
+    os.makedirs(corpus)
+    for number in range(SERVER_CANCEL_FILES):
+        with open(os.path.join(corpus, f"{number}.log"), "wb") as f:
+            f.write(SERVER_CANCEL_LINE * 40)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(_get("/search", path=corpus, q="error"))
+        await reader.readuntil(b"\r\n\r\n")
+        search_id = json.loads(await reader.readline())["id"]
+        await asyncio.sleep(0.2) # Let the scan run into the full buffers
+        status, reply = await _http(port, f"DELETE /search/{search_id} HTTP/1.1\r\n\r\n".encode())
+        rest = (await asyncio.wait_for(reader.read(), 30)).splitlines()
+    finally:
+        writer.close()
+    final = json.loads(rest[-1]) if rest else {}
+    yield "cancel", (None if status == 200 and final.get("type") == "cancelled"
+                     and final.get("files", SERVER_CANCEL_FILES) < SERVER_CANCEL_FILES
+                     else f"cancel status {status} {reply!r}, last message {final!r}")
+    _, health = await _http(port, b"GET /health HTTP/1.1\r\n\r\n")
+    yield "no searches left after cancel", None if health[0]["active"] == 0 else repr(health)
+
+
+async def _check_server(workdir):
+    loop = asyncio.get_running_loop()
+    listening = loop.create_future()
+    service = asyncio.ensure_future(serve("127.0.0.1", 0, ready=listening.set_result))
+    await asyncio.wait([listening, service], return_when=asyncio.FIRST_COMPLETED)
+    if service.done():
+        service.result() # Raises why it could not start
+    port = listening.result().sockets[0].getsockname()[1]
+    try:
+        return [item async for item in _server_checks(workdir, port)]
+    finally:
+        service.cancel()
+        await asyncio.gather(service, return_exceptions=True)
+
+
+def check_server(workdir):
+    """Run the HTTP service on localhost; returns (Divergence list, Counter of checks run)."""
+    divergences = []
+    runs = Counter()
+    for name, problem in asyncio.run(_check_server(workdir)):
+        runs["search service"] += 1
+        if problem:
+            divergences.append(Divergence(name, "error", "search service", problem))
+    return divergences, runs
+
+
+def check_structured(workdir, rng):
+    """Field queries on JSON and logfmt files against the query's own matches() on every line.
+
+    The raw-byte prefilter of query_line_test() must never throw away a line
+    the query accepts. Returns (Divergence list, Counter of modes run).
+    """
+    divergences = []
+    runs = Counter()
+    path = os.path.join(workdir, "structured.log")
+    for fmt, pool in STRUCTURED_LINES.items():
+        for trial in range(STRUCTURED_TRIALS):
+            data = b"\n".join(rng.choices(pool, k=rng.randint(1, 60))) + b"\n"
+            with open(path, "wb") as f:
+                f.write(data)
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                parser = detect_parser(path, f)
+            for text in STRUCTURED_QUERIES:
+                query = parse_query(text)
+                line_test = lambda line: query.matches(line, parser.parse(line) if parser is not None else None)
+                expected = reference_records(path, None, line_test)
+                raw_lines = split_raw_lines(data)
+                test = query_line_test(query, parser=parser)
+                hits = [idx for idx, raw in enumerate(raw_lines) if test(raw) is not None]
+                with open(path, "rb") as f:
+                    structured = scan_structured(f, query, path)
+                with open(path, "rb") as f:
+                    multi = scan_queries(f, [text, "\x00never\x00"], path)[0]
+                for mode, matches in (("query_line_test", file_matches_for_hits(raw_lines, hits)),
+                                      ("scan_structured", structured), ("scan_queries", multi)):
+                    mode = f"{fmt} field query, {mode}"
+                    runs[mode] += 1
+                    records = match_records(matches, data)
+                    if records != expected:
+                        divergences.append(Divergence(f"{fmt} #{trial}", text, mode,
+                                                      describe_difference(expected, records)))
+    return divergences, runs
+
+
+def random_corpus(rng):
+    """Random file from PIECES: sometimes dense with hits, sometimes without a final newline."""
+    pieces = rng.choices(PIECES, k=rng.randint(0, 400))
+    if rng.random() < 0.2:
+        pieces = [b"error\n" if piece == b"\n" else piece for piece in pieces] # Overlapping context everywhere
+    data = b"".join(pieces)
+    if rng.random() < 0.3:
+        data = data.rstrip(b"\r\n")
+    return data
+
+
+def random_keywords(rng, data):
+    keywords = rng.sample(KEYWORDS, 3)
+    text = data.decode("utf-8", "ignore")
+    if len(text) > 2:
+        start = rng.randrange(len(text) - 2)
+        keywords.append(text[start:start + rng.randint(1, 6)]) # Something that does occur
+    return keywords
+
+
+def run(trials, seed, workdir, save_dir=None, verbose=False):
+    """Check the adversarial cases and trials random corpora; returns (divergences, runs per mode)."""
+    rng = random.Random(seed)
+    cases = [(name, data, KEYWORDS) for name, data in ADVERSARIAL_CASES]
+    for trial in range(trials):
+        data = random_corpus(rng)
+        cases.append((f"random #{trial}", data, random_keywords(rng, data)))
+
+    divergences = []
+    runs = Counter()
+    for name, data, keywords in cases:
+        case_dir = tempfile.mkdtemp(dir=workdir)
+        try:
+            found, case_runs = check_case(name, data, keywords, case_dir)
+        finally:
+            shutil.rmtree(case_dir, ignore_errors=True)
+        runs.update(case_runs)
+        divergences.extend(found)
+        if found and save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+            with open(os.path.join(save_dir, name.replace(" ", "_").replace("#", "") + ".log"), "wb") as f:
+                f.write(data)
+        if verbose:
+            print(f"{name}: {'DIVERGED' if found else 'ok'}", flush=True)
+
+    found, structured_runs = check_structured(tempfile.mkdtemp(dir=workdir), rng)
+    runs.update(structured_runs)
+    divergences.extend(found)
+
+    found, server_runs = check_server(tempfile.mkdtemp(dir=workdir))
+    runs.update(server_runs)
+    divergences.extend(found)
+    return divergences, runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare every search path with the reference search.")
+    parser.add_argument("--trials", type=int, default=500, help="random corpora on top of the fixed cases")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-failures", metavar="DIR", help="write corpora that diverged to DIR")
+    parser.add_argument("--verbose", action="store_true", help="print every case")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="search_harness_")
+    try:
+        divergences, runs = run(args.trials, args.seed, workdir, args.save_failures, args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = Counter(divergence.mode for divergence in divergences)
+    width = max(map(len, runs))
+    for mode in runs:
+        print(f"{mode:<{width}}  {runs[mode]:>6} runs  {failed[mode]:>4} divergent")
+    for divergence in divergences[:20]:
+        print(f"\n[{divergence.mode}] {divergence.case}, keyword {divergence.keyword!r}:\n    {divergence.detail}")
+    if len(divergences) > 20:
+        print(f"\n... and {len(divergences) - 20} more")
+    print(f"\n{len(divergences)} divergences (seed {args.seed})")
+    return 1 if divergences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
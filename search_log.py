@@ -1,14 +1,42 @@
+import time
+_STARTUP_T0 = time.perf_counter() # Taken before any other import so startup timing includes them
+
 import os
+import sys
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, simpledialog
 from tkinter import ttk
-from tkinterdnd2 import DND_FILES, TkinterDnD
 import threading
 import queue # For thread-safe UI updates
-
-class LogSearchApp(TkinterDnD.Tk):
+from datetime import datetime
+# Feature modules (log_parsers, log_stats, log_timeline, log_session, log_index)
+# are imported by the handlers that use them, so they cost nothing before the first paint
+from log_engine import (DEFAULT_INCLUDE, DISPLAY_LINE_OVERHEAD, FileFilter, MatchTable, MemoryBudget, ProgressChannel,
+                        UpdateQueue, build_manifest, default_memory_budget, empty_file_matches, format_bytes, hit_spans,
+                        matches_memory, scan_manifest)
+
+# File open streaming: a small first chunk paints the first screen quickly,
+# the rest follows in large chunks to keep the number of UI callbacks low
+OPEN_FIRST_CHUNK_CHARS = 64 * 1024
+OPEN_CHUNK_CHARS = 1024 * 1024
+LINE_NUMBER_REFRESH_INTERVAL = 0.25 # Seconds between gutter refreshes while a file streams in
+PROGRESS_POLL_MS = 200 # How often the status bar samples the progress channel
+QUEUE_TIME_BUDGET = 0.05 # Max seconds of UI work per process_queue tick
+TIMELINE_BATCH_LINES = 500 # Timeline result lines gathered before one UI insert
+INDEX_CACHE_SHARE = 8 # 1/8 of the memory budget holds loaded indexes; searches get the rest
+RESULT_DISPLAY_LINES = 50000 # Result lines shown per search; the rest is kept as records only and exported
+
+# Time-to-first-window budget. Startup phases are printed to stderr when it is
+# exceeded, or always when SEARCH_LOG_PROFILE_STARTUP is set. The windowed build
+# has no stderr; there they are appended to STARTUP_LOG instead.
+STARTUP_BUDGET_MS = 750
+STARTUP_LOG = os.path.join(os.path.expanduser("~"), ".search_log", "startup.log")
+
+class LogSearchApp(tk.Tk):
     def __init__(self):
+        self.startup_marks = [("imports", time.perf_counter())]
         super().__init__()
+        self.startup_marks.append(("tk init", time.perf_counter()))
         self.title("Cruz's Log File Search")
         self.geometry("1000x700")
         self.minsize(700, 500)
@@ -29,6 +57,7 @@ class LogSearchApp(TkinterDnD.Tk):
                 'text_fg': '#000000',
                 'highlight': '#fffacd', # Softer lemon chiffon for highlight
                 'current_highlight': '#ffcc80', # Softer orange for current highlight
+                'hit_fg': '#c62828',    # Search keyword inside result lines
                 'find_bg': '#e8e8e8',   # Find dialog background
                 'status_bg': '#e0e0e0', # Status bar background
                 'border_color': '#dcdcdc', # Subtle border for frames
@@ -49,6 +78,7 @@ class LogSearchApp(TkinterDnD.Tk):
                 'text_fg': '#d4d4d4',   # Main text foreground (VS Code editor foreground)
                 'highlight': '#5f5f00', # Darker olive for highlight
                 'current_highlight': '#e65100', # Deep orange for current highlight
+                'hit_fg': '#ff8a65',    # Search keyword inside result lines
                 'find_bg': '#333333',   # Find dialog background
                 'status_bg': '#007acc', # VS Code blue for status bar
                 'border_color': '#4a4a4a', # Darker border
@@ -65,16 +95,93 @@ class LogSearchApp(TkinterDnD.Tk):
         self.find_entry = None
         self.search_thread = None
         self.stop_search = False
-        self.ui_update_queue = queue.Queue()
+        self.ui_update_queue = UpdateQueue() # Bounded: workers wait while the UI catches up
+        self.progress = ProgressChannel() # Status/progress travels here, not through ui_update_queue
+        self.file_filter = FileFilter() # Which files a folder search looks at (File -> Search Filters...)
+        self.results = MatchTable() # Compact records of the last search; text is re-read from the files on demand
+        self.batch_results = {} # Query -> MatchTable for the last batch search
+        self.shown_lines = 0 # Result lines of the last search put in the text widget
+        self.hidden_lines = 0 # Result lines of the last search kept as records only (display limit)
+        self.session = None # SearchSession of the last keyword search, checkpointed to disk while it runs
+        self.memory_budget = default_memory_budget() # Bytes of results/text kept per search or opened file
+        self.hit_terms = [] # Text highlighted in result lines; tagged only where the view currently is
+        # Indexes built in the background let searches skip files
+        self._index_store = None # IndexStore, created by _indexes() when first needed
+        self.indexer = None # IndexWatcher for the watched folders (File -> Watch Folders...)
+        self._hit_refresh_pending = False
+        self.collapse_repeats = tk.BooleanVar(value=False) # View -> Collapse Repeated Blocks
+        self.timeline_view = tk.BooleanVar(value=False) # View -> Merge Files by Time
+        self.filter_settings = {
+            'include': ", ".join(DEFAULT_INCLUDE),
+            'exclude': "",
+            'max_depth': "",
+            'max_size_mb': "",
+            'modified_since': ""
+        }
         self.current_font_size = 10 
+        self._line_number_count = 0
 
         self.setup_style()
         self.create_menus()
         self.create_widgets()
         self.bind_events()
         self.apply_theme()
+        self.startup_marks.append(("widgets", time.perf_counter()))
         self.process_queue()
+        self.poll_progress()
+        # Everything not needed for the first frame (welcome text, drag & drop) waits for it
+        self._first_paint_done = False
+        self.bind("<Map>", self._on_first_map, add="+")
+
+    def _on_first_map(self, event=None):
+        if self._first_paint_done:
+            return
+        self._first_paint_done = True
+        self.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        """Runs once the window has been drawn: record startup time, then do the deferred work."""
+        self.startup_marks.append(("first paint", time.perf_counter()))
+        self.startup_ms = (self.startup_marks[-1][1] - _STARTUP_T0) * 1000
+        if self.startup_ms > STARTUP_BUDGET_MS or os.environ.get("SEARCH_LOG_PROFILE_STARTUP"):
+            previous = _STARTUP_T0
+            phases = []
+            for name, mark in self.startup_marks:
+                phases.append(f"{name} {(mark - previous) * 1000:.0f} ms")
+                previous = mark
+            report = (f"Startup: {self.startup_ms:.0f} ms to first window (budget {STARTUP_BUDGET_MS} ms): "
+                      + ", ".join(phases))
+            if sys.stderr is not None:
+                print(report, file=sys.stderr)
+            else:
+                try:
+                    os.makedirs(os.path.dirname(STARTUP_LOG), exist_ok=True)
+                    with open(STARTUP_LOG, "a", encoding="utf-8") as f:
+                        f.write(f"{datetime.now():%Y-%m-%d %H:%M:%S} {report}\n")
+                except OSError:
+                    pass # Timing is diagnostics only; never let it stop the app from starting
         self.display_welcome_message()
+        self.after_idle(self._enable_drag_and_drop)
+        self.after_idle(self._start_watching)
+
+    def destroy(self):
+        # Workers may be waiting on the full update queue; let them run out instead of hanging
+        self.stop_search = True
+        self.ui_update_queue.close()
+        if self.indexer is not None:
+            self.indexer.stop()
+        super().destroy()
+
+    def _enable_drag_and_drop(self):
+        """Load tkinterdnd2 and the tkdnd Tcl package only after the window is up."""
+        try:
+            from tkinterdnd2 import DND_FILES, TkinterDnD
+            self.TkdndVersion = TkinterDnD.require(self) # The documented way to add tkdnd to an existing root
+        except (ImportError, AttributeError, RuntimeError): # AttributeError: tkinterdnd2 too old to have require()
+            self.update_status("Drag & drop unavailable - use File -> Open File/Folder...", False)
+            return
+        self.drop_entry.drop_target_register(DND_FILES)
+        self.drop_entry.dnd_bind("<<Drop>>", self.on_drop)
 
     def setup_style(self):
         """Configure ttk styles for modern appearance"""
@@ -118,11 +225,12 @@ class LogSearchApp(TkinterDnD.Tk):
                              borderwidth=0,
                              relief="flat")
         
-        # Frame style (for consistent background)
-        self.style.configure("TFrame", background=self.themes['light']['bg'])
-        self.style.configure("Search.TFrame", background=self.themes['light']['find_bg'], relief="solid", borderwidth=1) # For the find bar
-        self.style.configure("Separator.TFrame", background=self.themes['light']['separator_bg']) # Style for separator
-        self.style.configure("StatusBar.TFrame", background=self.themes['light']['status_bg'], relief="raised", borderwidth=0)
+        # Frame styles (colors are set per theme in configure_theme)
+        self.style.configure("Search.TFrame", relief="solid", borderwidth=1) # For the find bar
+        self.style.configure("StatusBar.TFrame", relief="raised", borderwidth=0)
+
+        # Colors for the active theme only; the other theme is configured if the user switches to it
+        self.configure_theme()
 
 
     def create_menus(self):
@@ -135,6 +243,12 @@ class LogSearchApp(TkinterDnD.Tk):
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Open File/Folder...", command=self.browse_file_or_folder)
         file_menu.add_command(label="Save Results As...", command=self.save_results_as) # Added Save Results As
+        file_menu.add_command(label="Batch Search...", command=self.show_batch_dialog)
+        file_menu.add_command(label="Keyword Statistics", command=self.start_stats_search)
+        file_menu.add_command(label="Search Filters...", command=self.show_filter_dialog)
+        file_menu.add_command(label="Recent Sessions...", command=self.show_sessions_dialog)
+        file_menu.add_command(label="Memory Budget...", command=self.set_memory_budget)
+        file_menu.add_command(label="Watch Folders...", command=self.show_watch_dialog)
         file_menu.add_separator()
         file_menu.add_command(label="Reset", command=self.reset_application_state) # Added Reset
         file_menu.add_separator()
@@ -156,47 +270,13 @@ class LogSearchApp(TkinterDnD.Tk):
         view_menu.add_command(label="Zoom Out (-)", command=self.zoom_out, accelerator="Ctrl+-")
         view_menu.add_separator()
         view_menu.add_command(label="Reset Zoom (100%)", command=self.reset_zoom, accelerator="Ctrl+0")
+        view_menu.add_separator()
+        view_menu.add_checkbutton(label="Collapse Repeated Blocks", variable=self.collapse_repeats)
+        view_menu.add_checkbutton(label="Merge Files by Time", variable=self.timeline_view)
 
-    def configure_light_theme(self):
-        """Configure styles for light theme"""
-        theme = self.themes['light']
-        self.style.configure("TButton", 
-                             background=theme['button_bg'], 
-                             foreground=theme['button_fg'])
-        self.style.map("TButton", 
-                        background=[('active', theme['select_bg'])],
-                        foreground=[('active', theme['select_fg'])])
-
-        self.style.configure("TEntry", 
-                             background=theme['entry_bg'], 
-                             foreground=theme['entry_fg'], 
-                             fieldbackground=theme['entry_bg'],
-                             bordercolor=theme['border_color'])
-        
-        self.style.configure("TLabel", 
-                             background=theme['bg'], 
-                             foreground=theme['fg'])
-        
-        self.style.configure("Vertical.TScrollbar", 
-                             troughcolor=theme['bg'], 
-                             background=theme['button_bg'],
-                             bordercolor=theme['border_color'],
-                             arrowcolor=theme['fg'])
-        self.style.map("Vertical.TScrollbar",
-                        background=[('active', theme['select_bg'])])
-        
-        self.style.configure("TProgressbar",
-                             troughcolor=theme['button_bg'])
-        
-        self.style.configure("TFrame", background=theme['bg'])
-        self.style.configure("Search.TFrame", background=theme['find_bg'])
-        self.style.configure("Separator.TFrame", background=theme['separator_bg'])
-        self.style.configure("StatusBar.TFrame", background=theme['status_bg'])
-
-
-    def configure_dark_theme(self):
-        """Configure styles for dark theme"""
-        theme = self.themes['dark']
+    def configure_theme(self):
+        """Configure ttk styles for the active theme"""
+        theme = self.themes['dark' if self.dark_mode else 'light']
         self.style.configure("TButton", 
                              background=theme['button_bg'], 
                              foreground=theme['button_fg'])
@@ -263,8 +343,7 @@ class LogSearchApp(TkinterDnD.Tk):
 
         self.drop_entry = ttk.Entry(self.file_input_frame, font=("Segoe UI", 10), style="TEntry")
         self.drop_entry.grid(row=0, column=0, sticky="ew", padx=(0, 0))
-        self.drop_entry.drop_target_register(DND_FILES)
-        self.drop_entry.dnd_bind("<<Drop>>", self.on_drop)
+        # Drop target is registered in _enable_drag_and_drop() after the first paint
 
         # Search section
         self.search_frame_container = ttk.Frame(self.main_frame, padding="10 0 10 10", style="TFrame")
@@ -336,7 +415,7 @@ class LogSearchApp(TkinterDnD.Tk):
         )
         
         self.v_scrollbar = ttk.Scrollbar(self.results_frame, orient="vertical", command=self._sync_scroll, style="Vertical.TScrollbar")
-        self.result_text.configure(yscrollcommand=self.v_scrollbar.set)
+        self.result_text.configure(yscrollcommand=self._on_result_yview)
         
         self.result_text.grid(row=0, column=2, sticky="nsew")
         self.v_scrollbar.grid(row=0, column=3, sticky="ns")
@@ -366,6 +445,7 @@ class LogSearchApp(TkinterDnD.Tk):
         self.progress_bar.grid(row=0, column=1, sticky="e", padx=5, pady=2)
         self.progress_bar.grid_remove()
 
+        self.result_text.tag_configure("hit", underline=True) # Below the find tags, which win where both apply
         self.result_text.tag_configure("highlight", foreground="black")
         self.result_text.tag_configure("current_highlight", foreground="black")
 
@@ -414,25 +494,65 @@ class LogSearchApp(TkinterDnD.Tk):
         self.after_idle(self._update_line_numbers)
 
 
+    def _on_result_yview(self, first, last):
+        """yscrollcommand of the results: move the scrollbar and highlight hits in the new view"""
+        self.v_scrollbar.set(first, last)
+        self._schedule_hit_highlight()
+
+    def _schedule_hit_highlight(self):
+        if self.hit_terms and not self._hit_refresh_pending:
+            self._hit_refresh_pending = True
+            self.after_idle(self._highlight_visible_hits)
+
+    def _highlight_visible_hits(self):
+        """Tag the search terms in the result lines currently on screen.
+
+        Only the visible lines are looked at, so the cost does not depend on
+        the number of results; lines scrolled into view are tagged then.
+        """
+        self._hit_refresh_pending = False
+        if not self.hit_terms:
+            return
+        first = int(self.result_text.index("@0,0").split(".")[0])
+        last = int(self.result_text.index(f"@0,{self.result_text.winfo_height()}").split(".")[0])
+        self.result_text.tag_remove("hit", f"{first}.0", f"{last}.end")
+        for line_no in range(first, last + 1):
+            text = self.result_text.get(f"{line_no}.0", f"{line_no}.end")
+            number, sep, line = text.partition(": ")
+            if not sep or not number.isdigit(): # Only result lines ("123: text"), not headers or notices
+                continue
+            prefix = len(number) + len(sep)
+            for start, end in hit_spans(line, self.hit_terms):
+                self.result_text.tag_add("hit", f"{line_no}.{prefix + start}", f"{line_no}.{prefix + end}")
+
+    def _set_hit_terms(self, queries):
+        """Terms to highlight for the given search queries (plain keywords or field queries)"""
+        terms = []
+        from log_parsers import parse_query
+        for text in queries:
+            query = parse_query(text)
+            terms.extend(query.highlight_terms() if query is not None else [text])
+        self.hit_terms = terms
+
     def _update_line_numbers(self):
         theme = self.themes['dark' if self.dark_mode else 'light']
         self.linenumbers.config(state="normal")
-        self.linenumbers.delete("1.0", tk.END)
-
-        content = self.result_text.get("1.0", "end-1c") 
-        total_lines = content.count('\n') + 1 if content else 0
-
-        line_numbers_text = ""
-        if total_lines > 0:
-            num_digits = len(str(total_lines))
-            self.linenumbers.config(width=max(4, num_digits + 1)) 
 
-            for i in range(1, total_lines + 1):
-                line_numbers_text += f"{i}\n"
-        else:
-            self.linenumbers.config(width=4) 
-        
-        self.linenumbers.insert("1.0", line_numbers_text)
+        # Ask the widget for its last index instead of copying the whole content
+        end_index = self.result_text.index("end-1c")
+        total_lines = 0 if end_index == "1.0" else int(end_index.split(".")[0])
+
+        # Only touch the gutter when the line count changed, and then only the numbers
+        # added or removed since: a file streaming in grows it every refresh tick
+        shown_lines = self._line_number_count
+        if total_lines != shown_lines:
+            self._line_number_count = total_lines
+            if total_lines > shown_lines:
+                self.linenumbers.insert("end-1c", "\n".join(map(str, range(shown_lines + 1, total_lines + 1))) + "\n")
+            else:
+                self.linenumbers.delete(f"{total_lines + 1}.0", "end-1c")
+            if len(str(total_lines)) != len(str(shown_lines)):
+                self.linenumbers.config(width=max(4, len(str(total_lines)) + 1) if total_lines else 4)
 
         self.linenumbers.tag_configure("line", 
                                        justify='right', 
@@ -444,6 +564,7 @@ class LogSearchApp(TkinterDnD.Tk):
         self.linenumbers.config(state="disabled")
 
     def _reset_line_numbers(self):
+        self._line_number_count = 0
         self.linenumbers.config(state="normal")
         self.linenumbers.delete("1.0", tk.END)
         self.linenumbers.config(state="disabled")
@@ -463,10 +584,7 @@ class LogSearchApp(TkinterDnD.Tk):
         else:
             self.dark_mode = not self.dark_mode
             
-        if self.dark_mode:
-            self.configure_dark_theme()
-        else:
-            self.configure_light_theme()
+        self.configure_theme()
         self.apply_theme()
         self._update_line_numbers()
 
@@ -507,6 +625,7 @@ class LogSearchApp(TkinterDnD.Tk):
                                        background=theme['line_num_bg'])
 
         # Update highlighting colors
+        self.result_text.tag_configure("hit", foreground=theme['hit_fg'])
         self.result_text.tag_configure("highlight", background=theme['highlight'], foreground=theme['text_fg'])
         self.result_text.tag_configure("current_highlight", background=theme['current_highlight'], foreground=theme['text_fg'])
         
@@ -530,8 +649,11 @@ class LogSearchApp(TkinterDnD.Tk):
                 widget.configure(background=theme['button_bg'], foreground=theme['button_fg'])
 
     def update_status(self, message, show_progress=False, progress_value=0):
-        """Thread-safe update status bar message and progress"""
-        self.ui_update_queue.put(lambda: self._update_status_ui(message, show_progress, progress_value))
+        """Thread-safe update status bar message and progress.
+
+        Only the latest status is kept; poll_progress() picks it up on its next tick.
+        """
+        self.progress.report(message, show_progress=show_progress, percent=progress_value)
 
     def _update_status_ui(self, message, show_progress, progress_value):
         """Actual UI update for status bar (called from main thread)"""
@@ -542,19 +664,34 @@ class LogSearchApp(TkinterDnD.Tk):
             self.progress_var.set(progress_value)
         else:
             self.progress_bar.grid_remove()
-        
-        self.update_idletasks()
+
+    def poll_progress(self):
+        """Sample the progress channel at a fixed rate (one status redraw per tick at most)"""
+        update = self.progress.poll()
+        if update is not None:
+            self._update_status_ui(ProgressChannel.describe(update), update.show_progress, update.percent)
+        self.after(PROGRESS_POLL_MS, self.poll_progress)
 
     def process_queue(self):
-        """Process UI updates from the queue"""
+        """Process UI updates from the queue.
+
+        Work is capped at QUEUE_TIME_BUDGET per tick so a flood of updates
+        never blocks scrolling; leftovers are picked up on the next, sooner tick.
+        """
+        deadline = time.monotonic() + QUEUE_TIME_BUDGET
+        delay = 100
         try:
             while True:
                 callback = self.ui_update_queue.get_nowait()
                 callback()
+                self._schedule_hit_highlight() # New text may have appeared in view
+                if time.monotonic() >= deadline:
+                    delay = 10 # More work pending, come back quickly
+                    break
         except queue.Empty:
             pass
         finally:
-            self.after(100, self.process_queue)
+            self.after(delay, self.process_queue)
 
     def display_welcome_message(self):
         """Displays a welcome message with instructions in the result_text area."""
@@ -565,6 +702,7 @@ Here's how to use this application:
 
 1.  **Select a File/Folder:**
     * **Drag & Drop:** Drag a log file (.log, .txt, .syslog, logcat) or a folder containing log files directly onto the "Drag & drop" entry field above.
+    * **Bundles:** .zip and .tar(.gz) archives are searched in place, without extracting them. Results are labeled like `bundle.zip!/path/app.log`.
     * **Menu:** Use the "File" menu -> "Open File/Folder..." to manually select a file or folder.
 
 2.  **Search for a Keyword:**
@@ -572,6 +710,7 @@ Here's how to use this application:
     * Click the "Search" button or press Enter.
     * The results will show matching lines from the selected file(s), along with 5 lines before and 5 lines after each match for context.
     * A green checkmark (✔) will appear if matches are found, or a red cross (✖) if not.
+    * **Structured logs:** JSON-lines, logfmt and logcat files can be searched by field, e.g. `level=ERROR`, `tag:ActivityManager` or `status>=500`. Terms are combined with AND; plain words still match anywhere in the line.
 
 3.  **Open a File (No Search):**
     * If you select a single file and leave the "Enter keyword to search" field blank, clicking "Search" will simply open and display the entire content of that file.
@@ -590,7 +729,10 @@ Here's how to use this application:
 7.  **Reset Application:**
     * Go to "File" menu -> "Reset" to clear all inputs, results, and reset the application to its initial state.
 
-8.  **Save Results:**
+8.  **Recent Sessions:**
+    * Searches are saved while they run. Go to "File" menu -> "Recent Sessions..." to reopen earlier results without searching again, or to resume a search that was cancelled or interrupted.
+
+9.  **Save Results:**
     * Go to "File" menu -> "Save Results As..." to save the content currently displayed in the results area to a text file.
 
 Enjoy searching your logs!
@@ -815,7 +957,9 @@ Enjoy searching your logs!
         """Allows user to browse for a file or folder (now only via menu)"""
         path = filedialog.askopenfilename(
             title="Select a Log File",
-            filetypes=[("Log Files", "*.log *.txt *.syslog *.logcat"), ("All Files", "*.*")]
+            filetypes=[("Log Files", "*.log *.txt *.syslog *.logcat"),
+                       ("Log Bundles", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz"),
+                       ("All Files", "*.*")]
         )
         
         if not path: 
@@ -832,6 +976,11 @@ Enjoy searching your logs!
             self.update_status("File/folder selection cancelled.", False)
             self.keyword_status_label.config(text="") # Clear status on cancellation
 
+    def _clear_results(self):
+        self.results = MatchTable()
+        self.batch_results = {}
+        self.shown_lines = self.hidden_lines = 0
+
     def reset_application_state(self):
         """Resets the application to its initial state."""
         if self.search_thread and self.search_thread.is_alive():
@@ -852,6 +1001,9 @@ Enjoy searching your logs!
         self.update_status("Ready", False)
         
         self.dropped_path = ""
+        self._clear_results()
+        self.session = None # Saved sessions stay on disk (File -> Recent Sessions...)
+        self.hit_terms = []
         self.search_matches = []
         self.current_match_index = -1
         self.stop_search = False
@@ -865,12 +1017,182 @@ Enjoy searching your logs!
         messagebox.showinfo("Reset Complete", "Application has been reset to its initial state.")
 
 
+    def show_filter_dialog(self):
+        """Dialog for the include/exclude patterns and limits used by folder searches."""
+        theme = self.themes['dark' if self.dark_mode else 'light']
+        dialog = tk.Toplevel(self)
+        dialog.title("Search Filters")
+        dialog.transient(self)
+        dialog.configure(bg=theme['bg'])
+        dialog.resizable(False, False)
+
+        frame = ttk.Frame(dialog, padding="10 10 10 10", style="TFrame")
+        frame.grid(row=0, column=0, sticky="nsew")
+        frame.grid_columnconfigure(1, weight=1)
+
+        fields = [
+            ('include', "Include patterns (comma separated):"),
+            ('exclude', "Exclude patterns, e.g. node_modules/, *.core:"),
+            ('max_depth', "Max folder depth (blank = unlimited):"),
+            ('max_size_mb', "Max file size in MB (blank = unlimited):"),
+            ('modified_since', "Modified since (YYYY-MM-DD):")
+        ]
+        entries = {}
+        for row, (key, label) in enumerate(fields):
+            ttk.Label(frame, text=label, style="TLabel").grid(row=row, column=0, sticky="w", padx=(0, 10), pady=3)
+            entry = ttk.Entry(frame, width=45, style="TEntry")
+            entry.insert(0, self.filter_settings[key])
+            entry.grid(row=row, column=1, sticky="ew", pady=3)
+            entries[key] = entry
+
+        def apply_filters():
+            settings = {key: entry.get().strip() for key, entry in entries.items()}
+            try:
+                self.file_filter = FileFilter(
+                    include=settings['include'] or DEFAULT_INCLUDE,
+                    exclude=settings['exclude'],
+                    max_depth=int(settings['max_depth']) if settings['max_depth'] else None,
+                    max_file_size=int(float(settings['max_size_mb']) * 1024 * 1024) if settings['max_size_mb'] else None,
+                    modified_since=datetime.strptime(settings['modified_since'], "%Y-%m-%d") if settings['modified_since'] else None
+                )
+            except ValueError as e:
+                messagebox.showerror("Invalid Filter", f"Could not apply filters:\n{e}", parent=dialog)
+                return
+            self.filter_settings = settings
+            self.update_status("Search filters updated", False)
+            dialog.destroy()
+
+        button_frame = ttk.Frame(frame, style="TFrame")
+        button_frame.grid(row=len(fields), column=0, columnspan=2, sticky="e", pady=(10, 0))
+        ttk.Button(button_frame, text="Apply", command=apply_filters, style="TButton").grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style="TButton").grid(row=0, column=1)
+        dialog.bind("<Return>", lambda e: apply_filters())
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        entries['include'].focus_set()
+
+    def set_memory_budget(self):
+        """Ask for the memory budget: how much a search or an opened file may keep for display."""
+        megabytes = simpledialog.askinteger(
+            "Memory Budget",
+            "Maximum memory for results and opened files, in MB.\n"
+            "Beyond it, searches only count the remaining hits and files are shown in part.",
+            initialvalue=self.memory_budget // (1024 * 1024), minvalue=16, parent=self)
+        if megabytes:
+            self.memory_budget = megabytes * 1024 * 1024
+            self._indexes().set_cache_bytes(self.memory_budget // INDEX_CACHE_SHARE)
+            self.update_status(f"Memory budget set to {megabytes} MB", False)
+
+    def _search_budget(self):
+        """MemoryBudget for one search, less the share the index cache may fill meanwhile"""
+        budget = MemoryBudget(self.memory_budget)
+        budget.charge(self._indexes().cache_bytes)
+        return budget
+
+    def _indexes(self):
+        """The IndexStore; log_index is imported on first use, after the window is up"""
+        if self._index_store is None:
+            from log_index import IndexStore
+            self._index_store = IndexStore(cache_bytes=self.memory_budget // INDEX_CACHE_SHARE)
+        return self._index_store
+
+    def _start_watching(self):
+        """Start indexing the saved watch folders; runs once after the first paint"""
+        from log_index import load_watch_folders
+        self._start_indexer(load_watch_folders())
+
+    def _start_indexer(self, folders):
+        """(Re)start background indexing of folders; it pauses while a search or file open runs"""
+        if self.indexer is not None:
+            self.indexer.stop()
+            self.indexer = None
+        if folders:
+            from log_index import IndexWatcher
+            self.indexer = IndexWatcher(self._indexes(), folders,
+                                        is_busy=lambda: self.search_thread is not None and self.search_thread.is_alive())
+            self.indexer.start()
+
+    def show_watch_dialog(self):
+        """Dialog for the folders indexed in the background so searches there can skip files."""
+        theme = self.themes['dark' if self.dark_mode else 'light']
+        dialog = tk.Toplevel(self)
+        dialog.title("Watch Folders")
+        dialog.transient(self)
+        dialog.configure(bg=theme['bg'])
+
+        frame = ttk.Frame(dialog, padding="10 10 10 10", style="TFrame")
+        frame.grid(row=0, column=0, sticky="nsew")
+        dialog.grid_rowconfigure(0, weight=1)
+        dialog.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(1, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+
+        ttk.Label(frame, text="Folders to index in the background, one per line:", style="TLabel").grid(row=0, column=0, sticky="w", pady=(0, 5))
+        folders_text = tk.Text(frame, width=60, height=8, font=("Consolas", 10), relief="flat", bd=1,
+                               bg=theme['text_bg'], fg=theme['text_fg'], insertbackground=theme['fg'])
+        folders_text.grid(row=1, column=0, sticky="nsew")
+        from log_index import load_watch_folders, save_watch_folders
+        folders = self.indexer.folders if self.indexer is not None else load_watch_folders()
+        if folders:
+            folders_text.insert("1.0", "\n".join(folders) + "\n")
+        indexed = self.indexer.indexed_files if self.indexer is not None else 0
+        ttk.Label(frame, text=f"Files indexed since start: {indexed}", style="TLabel").grid(row=2, column=0, sticky="w", pady=(5, 0))
+
+        def add_folder():
+            folder = filedialog.askdirectory(title="Select a Folder to Watch", parent=dialog)
+            if folder:
+                folders_text.insert(tk.END, folder + "\n")
+
+        def save():
+            folders = []
+            for line in folders_text.get("1.0", tk.END).splitlines():
+                if line.strip() and line.strip() not in folders:
+                    folders.append(line.strip())
+            missing = [folder for folder in folders if not os.path.isdir(folder)]
+            if missing:
+                messagebox.showwarning("Missing Folder", "Not a folder:\n" + "\n".join(missing), parent=dialog)
+                return
+            try:
+                save_watch_folders(folders)
+            except OSError as e:
+                messagebox.showerror("Save Error", f"Could not save the watch list:\n{e}", parent=dialog)
+                return
+            dialog.destroy()
+            self._start_indexer(folders)
+            self.update_status(f"Watching {len(folders)} folders" if folders else "Background indexing off", False)
+
+        button_frame = ttk.Frame(frame, style="TFrame")
+        button_frame.grid(row=3, column=0, sticky="e", pady=(10, 0))
+        ttk.Button(button_frame, text="Add Folder...", command=add_folder, style="TButton").grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(button_frame, text="Save", command=save, style="TButton").grid(row=0, column=1, padx=(0, 5))
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style="TButton").grid(row=0, column=2)
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        folders_text.focus_set()
+
+    def _skipped_notice(self, skipped_bytes):
+        """Status bar suffix for bytes an index let the search skip"""
+        return f", {format_bytes(skipped_bytes)} skipped (indexed)" if skipped_bytes else ""
+
+    def _budget_notice(self, budget, skipped_hits, skipped_files):
+        return (f"\n[Memory budget of {format_bytes(budget.limit)} reached: {skipped_hits} more hits in "
+                f"{skipped_files} files were counted but not listed. Narrow the search or raise the budget "
+                f"(File -> Memory Budget...).]\n")
+
     def save_results_as(self):
-        """Saves the content of the result_text widget to a file."""
-        content = self.result_text.get("1.0", tk.END).strip()
-        if not content:
-            messagebox.showwarning("No Content", "There is no content to save in the results area.")
+        """Saves the results to a file.
+
+        Search results are written from their records, lines read back from
+        the files, so lines past the display limit are included; anything else
+        (an opened file, a statistics report) is saved as shown.
+        """
+        if self.search_thread and self.search_thread.is_alive():
+            messagebox.showwarning("Busy", "Please wait for the current operation to finish or cancel it.")
             return
+        content = None
+        if not self.batch_results and not len(self.results):
+            content = self.result_text.get("1.0", tk.END).strip()
+            if not content:
+                messagebox.showwarning("No Content", "There is no content to save in the results area.")
+                return
 
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
@@ -880,11 +1202,23 @@ Enjoy searching your logs!
 
         if file_path:
             try:
+                self.config(cursor="watch")
+                self.update_idletasks()
                 with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                    if content is not None:
+                        f.write(content)
+                    elif self.batch_results:
+                        for idx, (query, table) in enumerate(self.batch_results.items()):
+                            f.write(f"\n===== Query {idx + 1}/{len(self.batch_results)}: \"{query}\" - "
+                                    f"{table.hit_count} hits in {len(table.files)} files =====\n")
+                            table.write_text(f)
+                    else:
+                        self.results.write_text(f)
+                self.config(cursor="")
                 self.update_status(f"Results saved to: {os.path.basename(file_path)}", False)
                 messagebox.showinfo("Save Successful", f"Results successfully saved to:\n{file_path}")
             except Exception as e:
+                self.config(cursor="")
                 messagebox.showerror("Save Error", f"Failed to save results:\n{e}")
                 self.update_status("Failed to save results.", False)
         else:
@@ -911,6 +1245,7 @@ Enjoy searching your logs!
         keyword = self.keyword_entry.get().strip()
         self.result_text.delete("1.0", tk.END)
         self._reset_line_numbers()
+        self._clear_results()
         
         if self.search_frame:
             self.hide_find_dialog()
@@ -924,162 +1259,687 @@ Enjoy searching your logs!
         self.search_button.config(text="Cancel", state="normal")
         self.keyword_status_label.config(text="") # Clear previous status
 
-        if not keyword and os.path.isfile(self.dropped_path):
+        self._set_hit_terms([keyword] if keyword else [])
+        from log_archive import is_archive
+        if not keyword and os.path.isfile(self.dropped_path) and not is_archive(self.dropped_path):
             self.search_thread = threading.Thread(target=self._open_file_threaded, args=(self.dropped_path,))
-        elif not keyword and os.path.isdir(self.dropped_path):
-            messagebox.showwarning("Missing Keyword", "Please enter a keyword to search a directory.")
+        elif not keyword and os.path.exists(self.dropped_path):
+            messagebox.showwarning("Missing Keyword", "Please enter a keyword to search a directory or archive.")
             self.search_button.config(text="Search", state="normal")
             self.update_status("Ready", False)
             self._update_keyword_status_ui(False) # No keyword for directory search means "not found"
             return
         else:
-            self.search_thread = threading.Thread(target=self._search_logs_threaded, args=(keyword,))
+            from log_parsers import parse_query
+            from log_stats import BlockCollapser
+            collapser = BlockCollapser() if self.collapse_repeats.get() else None
+            if self.timeline_view.get() and parse_query(keyword) is None:
+                self.search_thread = threading.Thread(target=self._timeline_search_threaded, args=(keyword, collapser))
+            else:
+                self.search_thread = threading.Thread(target=self._search_logs_threaded, args=(keyword, collapser))
         
         self.search_thread.start()
 
     def _open_file_threaded(self, file_path):
-        """Threaded function to open and display a single file"""
+        """Threaded function to open and display a single file.
+
+        The file is streamed in chunks: a small first chunk so the first screen
+        shows up right away, then large chunks for the rest.
+        """
         try:
-            self.update_status(f"Opening file: {os.path.basename(file_path)}...", True, 0)
+            self.progress.begin(f"Opening file: {os.path.basename(file_path)}...", os.path.getsize(file_path))
+            total_lines = 0
+            last_refresh = 0.0
+            last_char = "\n"
+            chunk_size = OPEN_FIRST_CHUNK_CHARS
+            budget = MemoryBudget(self.memory_budget)
             with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-                lines = file.readlines()
-                total_lines = len(lines)
-                for idx, line in enumerate(lines):
-                    if self.stop_search:
+                while not self.stop_search:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
                         break
-                    self.ui_update_queue.put(lambda l=line: self.result_text.insert(tk.END, l))
-                    progress = (idx / total_lines) * 100
-                    self.update_status(f"Opening... {idx}/{total_lines} lines", True, progress)
-            
+                    if not budget.charge(len(chunk) + chunk.count("\n") * DISPLAY_LINE_OVERHEAD):
+                        shown = file.buffer.tell() # Read ahead a little; close enough for the notice
+                        self.ui_update_queue.put(lambda: self.result_text.insert(tk.END,
+                            f"\n[Memory budget of {format_bytes(budget.limit)} reached: showing about the first "
+                            f"{format_bytes(shown)} of {format_bytes(os.path.getsize(file_path))}. "
+                            f"Search the file to see the lines you need.]\n"))
+                        break
+                    last_char = chunk[-1]
+                    self.ui_update_queue.put(lambda c=chunk: self.result_text.insert(tk.END, c))
+                    if chunk_size == OPEN_FIRST_CHUNK_CHARS:
+                        self.ui_update_queue.put(lambda: self.result_text.see("1.0"))
+                        chunk_size = OPEN_CHUNK_CHARS
+                    total_lines += chunk.count("\n")
+                    self.progress.report(f"Opening... {total_lines} lines", file.buffer.tell())
+
+                    now = time.monotonic()
+                    if now - last_refresh >= LINE_NUMBER_REFRESH_INTERVAL:
+                        last_refresh = now
+                        self.ui_update_queue.put(self._update_line_numbers)
+            if last_char != "\n":
+                total_lines += 1 # Last line has no trailing newline
+
             if self.stop_search:
-                self.update_status("Operation cancelled", False)
+                self.progress.finish("Operation cancelled")
+            elif budget.exceeded:
+                self.progress.finish(f"File '{os.path.basename(file_path)}' partly opened ({total_lines} lines) - memory budget reached")
             else:
-                self.update_status(f"File '{os.path.basename(file_path)}' opened. Total lines: {total_lines}", False)
+                self.progress.finish(f"File '{os.path.basename(file_path)}' opened. Total lines: {total_lines}")
             
             self.ui_update_queue.put(self._update_line_numbers)
 
         except Exception as e:
-            self.ui_update_queue.put(lambda: messagebox.showerror("Error", f"Error opening file: {str(e)}"))
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Error opening file: {str(err)}"))
         finally:
             self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
             self.ui_update_queue.put(lambda: self.keyword_status_label.config(text="")) # Clear status for non-keyword open
 
 
-    def _search_logs_threaded(self, keyword):
-        """Threaded log search function"""
+    def _collect_manifest(self):
+        """Build the file manifest for a search (worker thread); None if the path is invalid.
+
+        Excluded folders are pruned during the walk and archives expand to their
+        members. The manifest gives the totals for progress tracking and the
+        list of files to search.
+        """
+        if not os.path.exists(self.dropped_path):
+            self.update_status("Invalid file or folder.", False)
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False)) # Indicate invalid path as "not found"
+            return None
+        self.update_status("Collecting files...", False)
+        return build_manifest(self.dropped_path, self.file_filter)
+
+    def show_batch_dialog(self):
+        """Dialog to search for many keywords (one per line) in a single pass over the files."""
+        theme = self.themes['dark' if self.dark_mode else 'light']
+        dialog = tk.Toplevel(self)
+        dialog.title("Batch Search")
+        dialog.transient(self)
+        dialog.configure(bg=theme['bg'])
+
+        frame = ttk.Frame(dialog, padding="10 10 10 10", style="TFrame")
+        frame.grid(row=0, column=0, sticky="nsew")
+        dialog.grid_rowconfigure(0, weight=1)
+        dialog.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(1, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+
+        ttk.Label(frame, text="Keywords to search, one per line:", style="TLabel").grid(row=0, column=0, sticky="w", pady=(0, 5))
+        queries_text = tk.Text(frame, width=50, height=12, font=("Consolas", 10), relief="flat", bd=1,
+                               bg=theme['text_bg'], fg=theme['text_fg'], insertbackground=theme['fg'])
+        queries_text.grid(row=1, column=0, sticky="nsew")
+        keyword = self.keyword_entry.get().strip()
+        if keyword:
+            queries_text.insert("1.0", keyword + "\n")
+
+        def run_batch():
+            queries = []
+            for line in queries_text.get("1.0", tk.END).splitlines():
+                if line.strip() and line.strip() not in queries:
+                    queries.append(line.strip())
+            if not queries:
+                messagebox.showwarning("Missing Keyword", "Please enter at least one keyword.", parent=dialog)
+                return
+            dialog.destroy()
+            self.start_batch_search(queries)
+
+        button_frame = ttk.Frame(frame, style="TFrame")
+        button_frame.grid(row=2, column=0, sticky="e", pady=(10, 0))
+        ttk.Button(button_frame, text="Search All", command=run_batch, style="TButton").grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy, style="TButton").grid(row=0, column=1)
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        queries_text.focus_set()
+
+    def _start_worker(self, target, *args):
+        """Clear the results and run target(*args) on the search thread (batch and statistics modes); False if busy"""
+        if self.search_thread and self.search_thread.is_alive():
+            messagebox.showwarning("Busy", "Please wait for the current operation to finish or cancel it.")
+            return False
+        if not self.dropped_path:
+            messagebox.showwarning("Missing Info", "Please drag & drop a file/folder or use the menu to browse.")
+            return False
+
+        self.result_text.delete("1.0", tk.END)
+        self._reset_line_numbers()
+        self._clear_results()
+        if self.search_frame:
+            self.hide_find_dialog()
+
+        self.stop_search = False
+        self.search_button.config(text="Cancel", state="normal")
+        self.keyword_status_label.config(text="")
+        self.search_thread = threading.Thread(target=target, args=args)
+        self.search_thread.start()
+        return True
+
+    def show_sessions_dialog(self):
+        """Dialog listing saved search sessions: reopen their results or resume an unfinished search."""
+        theme = self.themes['dark' if self.dark_mode else 'light']
+        dialog = tk.Toplevel(self)
+        dialog.title("Recent Sessions")
+        dialog.transient(self)
+        dialog.configure(bg=theme['bg'])
+
+        frame = ttk.Frame(dialog, padding="10 10 10 10", style="TFrame")
+        frame.grid(row=0, column=0, sticky="nsew")
+        dialog.grid_rowconfigure(0, weight=1)
+        dialog.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(1, weight=1)
+        frame.grid_columnconfigure(0, weight=1)
+
+        ttk.Label(frame, text="Saved searches (newest first):", style="TLabel").grid(row=0, column=0, sticky="w", pady=(0, 5))
+        session_list = tk.Listbox(frame, width=110, height=12, font=("Consolas", 10), relief="flat", bd=1,
+                                  bg=theme['text_bg'], fg=theme['text_fg'], selectbackground=theme['select_bg'],
+                                  selectforeground=theme['select_fg'], activestyle="none")
+        session_list.grid(row=1, column=0, sticky="nsew")
+        from log_session import delete_session, describe_session, list_sessions
+        sessions = []
+
+        def refresh():
+            sessions[:] = list_sessions()
+            session_list.delete(0, tk.END)
+            for header in sessions:
+                session_list.insert(tk.END, describe_session(header))
+            if sessions:
+                session_list.selection_set(0)
+
+        def selected():
+            selection = session_list.curselection()
+            return sessions[selection[0]] if selection else None
+
+        def open_selected(resume):
+            header = selected()
+            if header is None:
+                return
+            dialog.destroy()
+            self._open_session(header, resume)
+
+        def delete_selected():
+            header = selected()
+            if header is not None:
+                delete_session(header["file"])
+                refresh()
+
+        button_frame = ttk.Frame(frame, style="TFrame")
+        button_frame.grid(row=2, column=0, sticky="e", pady=(10, 0))
+        ttk.Button(button_frame, text="Open Results", command=lambda: open_selected(False), style="TButton").grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(button_frame, text="Resume Search", command=lambda: open_selected(True), style="TButton").grid(row=0, column=1, padx=(0, 5))
+        ttk.Button(button_frame, text="Delete", command=delete_selected, style="TButton").grid(row=0, column=2, padx=(0, 5))
+        ttk.Button(button_frame, text="Close", command=dialog.destroy, style="TButton").grid(row=0, column=3)
+        session_list.bind("<Double-Button-1>", lambda e: open_selected(False))
+        dialog.bind("<Escape>", lambda e: dialog.destroy())
+        refresh()
+        session_list.focus_set()
+
+    def _open_session(self, header, resume):
+        """Load a saved session on the search thread; resume it if asked and it is unfinished"""
+        if self.search_thread and self.search_thread.is_alive():
+            messagebox.showwarning("Busy", "Please wait for the current operation to finish or cancel it.")
+            return
+        self.dropped_path = header["path"]
+        self.drop_entry.delete(0, tk.END)
+        self.drop_entry.insert(0, header["path"])
+        self.keyword_entry.delete(0, tk.END)
+        self.keyword_entry.insert(0, header["keyword"])
+        self.collapse_repeats.set(header["collapse"])
+        if self._start_worker(self._session_threaded, header["file"], resume):
+            self._set_hit_terms([header["keyword"]])
+
+    def _session_threaded(self, file_path, resume):
+        """Show a saved session's results, then continue its search when resuming"""
         try:
-            matched = False
-            total_files = 0
+            from log_session import SearchSession
+            from log_stats import BlockCollapser
+            self.update_status("Loading session...", False)
+            session = SearchSession.load(file_path)
+            collapser = BlockCollapser() if session.collapse else None
+            if resume and session.resumable:
+                self._search_logs_threaded(session.keyword, collapser, session)
+                return
+
+            self.session = session
+            self.results = results = session.results
+            matched = self._show_stored_results(results, collapser, self._search_budget())
+            if not matched:
+                self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, "No matches found.\n"))
+            if collapser is not None:
+                self.ui_update_queue.put(lambda: self._annotate_collapsed_blocks(collapser))
+            self._queue_hidden_notice()
+            unfinished = f", {session.files_done}/{len(session.manifest)} files searched" if session.resumable else ""
+            self.progress.finish(f"Session opened - {results.hit_count} hits, {len(results)} lines found{unfinished}")
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(matched))
+            self.ui_update_queue.put(self._update_line_numbers)
+        except Exception as e:
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Could not open session: {str(err)}"))
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+        finally:
+            self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
+
+    def start_batch_search(self, queries):
+        """Start a batch search for several keywords in a separate thread"""
+        if self._start_worker(self._batch_search_threaded, queries):
+            self._set_hit_terms(queries)
+
+    def start_stats_search(self):
+        """Compute aggregate statistics for the current keyword instead of listing every hit"""
+        keyword = self.keyword_entry.get().strip()
+        if not keyword:
+            messagebox.showwarning("Missing Keyword", "Please enter a keyword to compute statistics for.")
+            return
+        if self._start_worker(self._stats_search_threaded, keyword):
+            self.hit_terms = []
+
+    def _stats_search_threaded(self, keyword):
+        """Threaded statistics scan: only counters are kept, the report is rendered at the end"""
+        try:
+            from log_parsers import parse_query
+            from log_stats import KeywordStats, scan_stats
+            manifest = self._collect_manifest()
+            if manifest is None:
+                return
+
+            total_files = len(manifest)
+            self.progress.begin(f"Computing statistics in {total_files} files...", sum(entry.size for entry in manifest))
+            stats = KeywordStats(keyword)
+            processed_bytes = 0
+            query = parse_query(keyword) # Field queries count the lines they match, like a search lists them
+            scan = lambda entry, binary_file: scan_stats(binary_file, keyword, query=query, label=entry.label)
+            for entry, file_stats, error in scan_manifest(manifest, scan, lambda: self.stop_search):
+                if error is not None:
+                    self.ui_update_queue.put(lambda fp=entry.label, err=error: 
+                        self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
+                else:
+                    stats.add(entry.label, file_stats)
+                processed_bytes += entry.size
+                self.progress.report(
+                    f"Computing statistics... {stats.files_searched}/{total_files} files, {stats.hits} hits", processed_bytes)
+
+            report = stats.report()
+            self.ui_update_queue.put(lambda: self.result_text.insert("1.0", report))
+            if self.stop_search:
+                self.progress.finish("Statistics cancelled (partial results shown)")
+            else:
+                self.progress.finish(f"Statistics complete - {stats.hits} hits in {len(stats.hits_per_file)} files")
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(stats.hits > 0))
+            self.ui_update_queue.put(self._update_line_numbers)
+
+        except Exception as e:
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Statistics error: {str(err)}"))
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+        finally:
+            self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
+
+    def _insert_batch_sections(self, queries):
+        """One results section per query. Blocks are inserted at each section's end mark
+        as they arrive; the hit count is filled in at the count mark when the search ends."""
+        section_starts = []
+        for idx, query in enumerate(queries):
+            section_starts.append(self.result_text.index("end-1c"))
+            self.result_text.insert(tk.END, f"\n===== Query {idx + 1}/{len(queries)}: \"{query}\"")
+            self.result_text.mark_set(f"batch_count_{idx}", "end-1c")
+            self.result_text.mark_gravity(f"batch_count_{idx}", "left")
+            self.result_text.insert(tk.END, " =====\n")
+        section_starts.append(self.result_text.index("end-1c"))
+        self.result_text.insert(tk.END, "\n") # Keeps text added at the end (errors) out of the last section
+        # A section ends where the next one starts; the default right gravity keeps
+        # each end mark behind the blocks inserted at it
+        for idx in range(len(queries)):
+            self.result_text.mark_set(f"batch_end_{idx}", section_starts[idx + 1])
+
+    def _finish_batch_sections(self, tables, unlisted):
+        for idx, (table, (hits, files)) in enumerate(zip(tables, unlisted)):
+            if not len(table) and not hits:
+                self.result_text.insert(f"batch_end_{idx}", "No matches found.\n")
+            if hits:
+                self.result_text.insert(f"batch_end_{idx}", f"[{hits} more hits in {files} files not listed: memory budget reached]\n")
+            self.result_text.insert(f"batch_count_{idx}", f" - {table.hit_count + hits} hits in {len(table.files) + files} files")
+
+    def _batch_search_threaded(self, queries):
+        """Threaded batch search: every file is read once and tested against all queries"""
+        try:
+            from log_parsers import parse_query, scan_queries
+            manifest = self._collect_manifest()
+            if manifest is None:
+                return
+
+            total_files = len(manifest)
+            self.progress.begin(f"Batch searching {len(queries)} keywords in {total_files} files...",
+                                sum(entry.size for entry in manifest))
+            tables = [MatchTable() for _ in queries]
+            self.batch_results = dict(zip(queries, tables))
+            self.ui_update_queue.put(lambda: self._insert_batch_sections(queries))
+
             processed_files = 0
+            processed_bytes = 0
+            budget = self._search_budget()
+            unlisted = [[0, 0] for _ in queries] # Hits and files per query only counted once over budget
+            plain_queries = [q for q in queries if parse_query(q) is None]
+            skipped_bytes = 0 # Not read because the index rules the file out
+            index_store = self._indexes()
+
+            def scan(entry, binary_file):
+                """(matches per query, bytes skipped)"""
+                if len(plain_queries) == len(queries) and index_store.rules_out(entry, queries):
+                    return [empty_file_matches() for _ in queries], entry.size
+                return scan_queries(binary_file, queries, entry.label, max_lines=budget.lines_left()), 0
+            for entry, scanned, error in scan_manifest(manifest, scan, lambda: self.stop_search):
+                if error is not None:
+                    self.ui_update_queue.put(lambda fp=entry.label, err=error: 
+                        self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
+                else:
+                    matches_per_query, skipped = scanned
+                    skipped_bytes += skipped
+                    for idx, (table, file_matches) in enumerate(zip(tables, matches_per_query)):
+                        hits = file_matches if isinstance(file_matches, int) else sum(file_matches.hit_flags)
+                        if hits and (isinstance(file_matches, int)
+                                     or not budget.charge(matches_memory(file_matches, self._display_room()))):
+                            unlisted[idx][0] += hits
+                            unlisted[idx][1] += 1
+                            continue
+                        start, stop = table.add_file(entry, file_matches)
+                        if start < stop:
+                            self._queue_blocks(table, start, stop, file_matches.lines, mark=f"batch_end_{idx}")
+                processed_files += 1
+                processed_bytes += entry.size
+                self.progress.report(
+                    f"Batch searching... {processed_files}/{total_files} files, "
+                    f"{sum(t.hit_count for t in tables) + sum(hits for hits, _ in unlisted)} hits"
+                    f"{self._skipped_notice(skipped_bytes)}", processed_bytes)
+
+            self.ui_update_queue.put(lambda: self._finish_batch_sections(tables, unlisted))
+            self._queue_hidden_notice()
+            matched = any(t.hit_count for t in tables) or any(hits for hits, _ in unlisted)
+            if self.stop_search:
+                self.progress.finish("Batch search cancelled")
+                self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+            else:
+                over_budget = " - memory budget reached, some hits only counted" if budget.exceeded else ""
+                self.progress.finish("Batch search complete - " +
+                                     ", ".join(f"{q}: {t.hit_count + u[0]}" for q, t, u in zip(queries, tables, unlisted))
+                                     + over_budget + self._skipped_notice(skipped_bytes))
+                self.ui_update_queue.put(lambda: self._update_keyword_status_ui(matched))
+            self.ui_update_queue.put(self._update_line_numbers)
+
+        except Exception as e:
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Batch search error: {str(err)}"))
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+        finally:
+            self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
+
+    def _search_logs_threaded(self, keyword, collapser=None, session=None):
+        """Threaded log search function; with a BlockCollapser, repeated blocks are shown once.
+
+        Progress and results are checkpointed to a session file. Given a saved
+        session, its results are shown again and the search resumes after the
+        last finished file.
+        """
+        try:
+            from log_index import scan_indexed
+            from log_parsers import parse_query, scan_structured
+            from log_session import SearchSession
+            matched = False
             
-            # Count total files first for progress tracking
-            if os.path.isdir(self.dropped_path):
-                for root, _, files in os.walk(self.dropped_path):
-                    for file in files:
-                        if (file.lower().endswith((".log", ".txt", ".syslog", ".logcat"))
-                            or file.lower().startswith("logcat.")):
-                            total_files += 1
-            elif os.path.isfile(self.dropped_path):
-                total_files = 1
+            budget = self._search_budget()
+            if session is not None:
+                matched = self._show_stored_results(session.results, collapser, budget)
             else:
-                self.update_status("Invalid file or folder.", False)
-                self._update_keyword_status_ui(False) # Indicate invalid path as "not found"
-                return
+                manifest = self._collect_manifest()
+                if manifest is None:
+                    return
+                session = SearchSession(keyword, self.dropped_path, manifest, collapse=collapser is not None)
+            session.status = "running"
+            self.session = session
+            self.results = results = session.results
             
-            self.update_status(f"Searching in {total_files} files...", True, 0)
+            total_files = len(session.manifest)
+            total_bytes = session.total_bytes
+            resumed_bytes = session.bytes_done
+            # Rate and ETA count what is left; the percentage covers the whole search
+            self.progress.begin(f"Searching in {total_files} files...", total_bytes - resumed_bytes)
             
-            if os.path.isdir(self.dropped_path):
-                for root, _, files in os.walk(self.dropped_path):
-                    if self.stop_search:
-                        break
-                    for file in files:
-                        if self.stop_search:
-                            break
-                        if (file.lower().endswith((".log", ".txt", ".syslog", ".logcat"))
-                            or file.lower().startswith("logcat.")):
-                            file_path = os.path.join(root, file)
-                            matched |= self.search_file(file_path, keyword)
-                            processed_files += 1
-                            progress = (processed_files / total_files) * 100
-                            self.update_status(
-                                f"Searching... {processed_files}/{total_files} files", True, progress)
-            elif os.path.isfile(self.dropped_path):
-                self.update_status("Searching file...", True, 0)
-                matched = self.search_file(self.dropped_path, keyword)
-                self.update_status("Search complete", True, 100)
+            # Once the memory budget is used up, files are only counted
+            query = parse_query(keyword) # Field-scoped query (level=ERROR ...) or None for a plain keyword
+            skipped_bytes = 0 # Not read because a precomputed index showed the keyword cannot be there
+            index_store = self._indexes()
+
+            def scan(entry, binary_file):
+                """(matches, bytes skipped)"""
+                if query is not None:
+                    return scan_structured(binary_file, query, entry.label, max_lines=budget.lines_left()), 0
+                return scan_indexed(binary_file, entry, keyword, index_store.lookup_entry(entry),
+                                    max_lines=budget.lines_left())
+            unlisted_hits = unlisted_files = 0
+            for entry, scanned, error in scan_manifest(session.remaining(), scan, lambda: self.stop_search):
+                file_matches, skipped = scanned if error is None else (None, 0)
+                skipped_bytes += skipped
+                if error is not None:
+                    self.ui_update_queue.put(lambda fp=entry.label, err=error: 
+                        self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
+                elif isinstance(file_matches, int) or not budget.charge(matches_memory(file_matches, self._display_room())):
+                    hits = file_matches if isinstance(file_matches, int) else sum(file_matches.hit_flags)
+                    if hits:
+                        matched = True
+                        unlisted_hits += hits
+                        unlisted_files += 1
+                else:
+                    matched |= self.search_file(results, entry, file_matches, collapser)
+                session.advance(entry)
+                session.checkpoint()
+                self.progress.report(
+                    f"Searching... {session.files_done}/{total_files} files{self._skipped_notice(skipped_bytes)}",
+                    session.bytes_done - resumed_bytes,
+                    percent=session.bytes_done / total_bytes * 100 if total_bytes else None)
             
             if not matched and not self.stop_search:
                 self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, "No matches found.\n"))
             
+            if collapser is not None:
+                self.ui_update_queue.put(lambda: self._annotate_collapsed_blocks(collapser))
+            self._queue_hidden_notice()
+            
+            if unlisted_hits:
+                notice = self._budget_notice(budget, unlisted_hits, unlisted_files)
+                self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, notice))
+            
             if self.stop_search:
-                self.update_status("Search cancelled", False)
+                session.finish("cancelled")
+                self.progress.finish("Search cancelled - resume it from File -> Recent Sessions...")
                 self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False)) # Indicate cancelled search as "not found" visually
             else:
-                matches_found = self.result_text.get("1.0", tk.END).count("\n") - 1
-                self.update_status(f"Search complete - {matches_found} lines found", False)
+                session.finish("complete")
+                collapsed = f", {collapser.collapsed_blocks} repeated blocks collapsed" if collapser else ""
+                over_budget = f", {unlisted_hits} more hits counted only (memory budget reached)" if unlisted_hits else ""
+                self.progress.finish(f"Search complete - {results.hit_count} hits, {len(results)} lines found"
+                                     f"{collapsed}{over_budget}{self._skipped_notice(skipped_bytes)}")
                 self.ui_update_queue.put(lambda: self._update_keyword_status_ui(matched)) # Update status based on actual search result
             
             self.ui_update_queue.put(self._update_line_numbers)
 
         except Exception as e:
-            self.ui_update_queue.put(lambda: messagebox.showerror("Error", f"Search error: {str(e)}"))
+            if session is not None and session.status == "running":
+                try:
+                    session.finish("failed") # Keeps the last state so the search can be resumed
+                except OSError:
+                    pass
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Search error: {str(err)}"))
             self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False)) # Indicate error as "not found"
         finally:
             self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
 
-    def search_file(self, file_path, keyword):
-        found = False
+    def _timeline_search_threaded(self, keyword, collapser=None):
+        """Threaded keyword search whose blocks from all files are merged in timestamp order.
+
+        Every block still names its file. Results are not checkpointed to a session.
+        """
         try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as file:
-                lines = file.readlines()
-                
-                # Collect all relevant line ranges
-                context_ranges = []
-                for idx, line in enumerate(lines):
-                    if keyword.lower() in line.lower():
-                        start_context_idx = max(0, idx - 5)
-                        end_context_idx = min(len(lines) - 1, idx + 5)
-                        context_ranges.append((start_context_idx, end_context_idx))
-                
-                if not context_ranges:
-                    return False # No matches found in this file
-
-                # Sort ranges by their start index
-                context_ranges.sort()
-
-                # Merge overlapping or adjacent ranges
-                merged_ranges = []
-                if context_ranges:
-                    current_start, current_end = context_ranges[0]
-                    for i in range(1, len(context_ranges)):
-                        next_start, next_end = context_ranges[i]
-                        # If the next range overlaps or is adjacent (+5 for continuity of context)
-                        if next_start <= current_end + 5: 
-                            current_end = max(current_end, next_end)
-                        else:
-                            merged_ranges.append((current_start, current_end))
-                            current_start, current_end = next_start, next_end
-                    merged_ranges.append((current_start, current_end)) # Add the last merged range
-
-                # Print the merged ranges
-                for start_idx, end_idx in merged_ranges:
-                    found = True
-                    self.ui_update_queue.put(lambda fp=file_path, s_idx=start_idx: 
-                        self.result_text.insert(tk.END, f"\n--- {fp} (Context around line {s_idx+1}) ---\n"))
-                    
-                    for i in range(start_idx, end_idx + 1):
-                        if self.stop_search:
-                            break
-                        current_line_num = i + 1
-                        current_line_content = lines[i]
-                        self.ui_update_queue.put(lambda ln=current_line_num, lc=current_line_content: 
-                            self.result_text.insert(tk.END, f"{ln}: {lc}"))
-                    
-                    self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, "---\n")) # Separator for context block
+            from log_timeline import TimelineMerge
+            manifest = self._collect_manifest()
+            if manifest is None:
+                return
+            self.session = None
+            self.results = results = MatchTable()
+            budget = self._search_budget()
+            timeline = TimelineMerge(manifest, keyword, lambda: self.stop_search)
+            total_bytes = sum(entry.size for entry in timeline.entries)
+            self.progress.begin(f"Merging matches of {len(timeline.entries)} files by time...", total_bytes)
+
+            # Blocks arrive one at a time; they are shown in batches of about TIMELINE_BATCH_LINES lines
+            batch_start, batch_lines = 0, []
+            unlisted_hits = 0
+            unlisted_files = set()
+            for block in timeline:
+                if block.error is not None:
+                    self.ui_update_queue.put(lambda fp=block.entry.label, err=block.error:
+                        self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
+                elif unlisted_hits or not budget.charge(matches_memory(block.matches, self._display_room())):
+                    unlisted_hits += sum(block.matches.hit_flags)
+                    unlisted_files.add(block.entry)
+                else:
+                    results.add_file(block.entry, block.matches)
+                    batch_lines.extend(block.matches.lines)
+                    if len(batch_lines) >= TIMELINE_BATCH_LINES:
+                        self._queue_blocks(results, batch_start, len(results), batch_lines, collapser)
+                        batch_start, batch_lines = len(results), []
+                self.progress.report(f"Merging by time... {results.hit_count + unlisted_hits} hits", timeline.bytes_read)
+            if batch_lines:
+                self._queue_blocks(results, batch_start, len(results), batch_lines, collapser)
+
+            matched = results.hit_count + unlisted_hits > 0
+            if not matched and not self.stop_search:
+                self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, "No matches found.\n"))
+            if collapser is not None:
+                self.ui_update_queue.put(lambda: self._annotate_collapsed_blocks(collapser))
+            self._queue_hidden_notice()
+            if unlisted_hits:
+                notice = self._budget_notice(budget, unlisted_hits, len(unlisted_files))
+                self.ui_update_queue.put(lambda: self.result_text.insert(tk.END, notice))
+            if timeline.skipped_entries:
+                skipped = len(timeline.skipped_entries)
+                self.ui_update_queue.put(lambda: self.result_text.insert(tk.END,
+                    f"\n[{skipped} files inside tar archives are not part of the time-merged view; "
+                    f"turn off View -> Merge Files by Time to search them.]\n"))
+
+            if self.stop_search:
+                self.progress.finish("Search cancelled")
+                self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+            else:
+                collapsed = f", {collapser.collapsed_blocks} repeated blocks collapsed" if collapser else ""
+                self.progress.finish(f"Search complete - {results.hit_count + unlisted_hits} hits merged by time "
+                                     f"from {len(timeline.entries)} files{collapsed}")
+                self.ui_update_queue.put(lambda: self._update_keyword_status_ui(matched))
+            self.ui_update_queue.put(self._update_line_numbers)
+
         except Exception as e:
-            self.ui_update_queue.put(lambda fp=file_path, err=e: 
-                self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
-        return found
+            self.ui_update_queue.put(lambda err=e: messagebox.showerror("Error", f"Search error: {str(err)}"))
+            self.ui_update_queue.put(lambda: self._update_keyword_status_ui(False))
+        finally:
+            self.ui_update_queue.put(lambda: self.search_button.config(text="Search", state="normal"))
+
+    def search_file(self, results, entry, file_matches, collapser=None):
+        """Record one searched file's matches and queue them for display; returns True if it had hits.
+
+        Only the compact records are kept. A single UI callback formats and
+        inserts the file's blocks, instead of one closure per line.
+        """
+        start, stop = results.add_file(entry, file_matches)
+        if start == stop:
+            return False
+        self._queue_blocks(results, start, stop, file_matches.lines, collapser)
+        return True
+
+    def _display_room(self):
+        """Result lines the text widget can still take in this search"""
+        return max(0, RESULT_DISPLAY_LINES - self.shown_lines)
+
+    def _fit_display(self, results, start, stop):
+        """Count records start..stop-1 as shown as far as the display limit allows; returns where the shown part ends"""
+        cut = min(stop, start + self._display_room())
+        self.shown_lines += cut - start
+        self.hidden_lines += stop - cut
+        return cut
+
+    def _queue_hidden_notice(self):
+        if self.hidden_lines:
+            hidden = self.hidden_lines
+            self.ui_update_queue.put(lambda: self.result_text.insert(tk.END,
+                f"\n[{hidden} more result lines are not shown (display limit of {RESULT_DISPLAY_LINES} lines). "
+                f"File -> Save Results As... exports all of them.]\n"))
+
+    def _queue_blocks(self, results, start, stop, lines, collapser=None, mark=tk.END):
+        """Queue display of records start..stop-1 of one file, whose text is lines.
+
+        Past RESULT_DISPLAY_LINES only the records are kept; their text is
+        read back from the files when the results are exported.
+        """
+        if collapser is None:
+            stop = self._fit_display(results, start, stop)
+            if stop > start:
+                self.ui_update_queue.put(lambda: self.result_text.insert(
+                    mark, results.format_blocks(start, stop, lines[:stop - start])))
+            return
+
+        # Collapse mode: only the first block of each kind is shown; a mark after it
+        # is where its "×N occurrences" summary goes once the search is done
+        new_blocks = []
+        for block_start, block_stop in results.iter_blocks(start, stop):
+            label = results.files[results.file_ids[block_start]].label
+            block_lines = lines[block_start - start:block_stop - start]
+            group, is_new = collapser.add(block_lines, label, results.line_nos[block_start])
+            if not is_new:
+                continue
+            shown_stop = self._fit_display(results, block_start, block_stop)
+            if shown_stop > block_start:
+                new_blocks.append((group.group_id, results.format_blocks(block_start, shown_stop,
+                                                                         block_lines[:shown_stop - block_start])))
+        if new_blocks:
+            self.ui_update_queue.put(lambda: self._insert_collapsible_blocks(new_blocks))
+
+    def _show_stored_results(self, results, collapser=None, budget=None):
+        """Queue display of a saved session's results, reading the lines back from the files (worker thread).
+
+        Stops showing (with a notice) once the budget or the display limit is used up; the records stay in results.
+        """
+        start = 0
+        while start < len(results) and not self.stop_search:
+            file_id = results.file_ids[start]
+            stop = start
+            while stop < len(results) and results.file_ids[stop] == file_id:
+                stop += 1
+            if not self._display_room():
+                self._fit_display(results, start, len(results)) # Counted for the notice; no need to read them
+                break
+            try:
+                lines = results.read_lines(start, stop)
+                if budget is not None and not budget.charge(sum(map(len, lines)) + len(lines) * DISPLAY_LINE_OVERHEAD):
+                    hidden = sum(results.hit_flags[start:])
+                    self.ui_update_queue.put(lambda: self.result_text.insert(tk.END,
+                        f"\n[Memory budget of {format_bytes(budget.limit)} reached: {hidden} saved hits are not shown.]\n"))
+                    break
+                self._queue_blocks(results, start, stop, lines, collapser)
+            except Exception as e: # File changed or gone since the session was saved
+                self.ui_update_queue.put(lambda fp=results.files[file_id].label, err=e:
+                    self.result_text.insert(tk.END, f"Error reading {fp}: {err}\n"))
+            start = stop
+        return len(results) > 0
+
+    def _insert_collapsible_blocks(self, blocks):
+        for group_id, text in blocks:
+            self.result_text.insert(tk.END, text)
+            self.result_text.mark_set(f"collapse_{group_id}", "end-1c")
+            self.result_text.mark_gravity(f"collapse_{group_id}", "left")
+
+    def _annotate_collapsed_blocks(self, collapser):
+        """Add the occurrence summary under every block that repeated, then drop the marks"""
+        marks = {mark for mark in self.result_text.mark_names() if mark.startswith("collapse_")}
+        for group in collapser.repeated_groups():
+            if f"collapse_{group.group_id}" in marks:
+                self.result_text.insert(f"collapse_{group.group_id}", group.summary())
+        if collapser.dropped_groups:
+            self.result_text.insert(tk.END, f"\n(... and {collapser.dropped_groups} more repeated blocks "
+                                            "without an occurrence summary)\n")
+        for mark in marks:
+            self.result_text.mark_unset(mark)
 
 
 if __name__ == "__main__":
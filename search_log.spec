@@ -26,7 +26,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False, # UPX-packed binaries must be decompressed on every launch, which slows cold start
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
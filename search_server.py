@@ -0,0 +1,327 @@
+"""Local HTTP/JSON search service: the desktop app's search engine without a desktop session.
+
+Run with:
+    python search_server.py [--host 127.0.0.1] [--port 8765] [--unix PATH] [--workers 4]
+
+Endpoints:
+    GET  /health                          -> {"status": "ok", "active": N}
+    GET  /search?path=...&q=...           -> results as newline-delimited JSON
+    POST /search  {"path", "query", "include", "exclude", "max_depth", "max_file_size", "max_lines", "memory_mb"}
+    POST /cancel/<id>  (or DELETE /search/<id>)
+
+A search streams one JSON object per line: a "start" line carrying the
+search id, one "block" line per context block, then a "done" (or
+"cancelled"/"error") line. The response ends when the connection closes.
+Once a search has listed max_lines result lines or used up its memory
+budget (memory_mb, default SEARCH_LOG_MEMORY_MB), further files are only
+counted: one "file_hits" line each, totalled as unlisted_hits in "done".
+
+All searches share one bounded worker pool, and a search reads zip members
+one by one on its own worker, so the pool size bounds the scanning threads.
+When a client reads slowly, its search pauses instead of buffering results.
+Closing the connection cancels the search. There is no authentication, so
+only bind to localhost or a private Unix socket.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from log_engine import (FileFilter, MatchTable, MemoryBudget, build_manifest, matches_memory, scan_manifest,
+                        scan_matches)
+from log_parsers import parse_query, scan_structured
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+RESULT_QUEUE_SIZE = 64 # Pending result messages per search before the scan thread waits for the client
+MAX_REQUEST_BYTES = 64 * 1024
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large"}
+
+
+class SearchRequestError(Exception):
+    """Malformed request; reported to the client as HTTP 400."""
+
+
+class _Search:
+    """State of one running search."""
+
+    def __init__(self, search_id):
+        self.id = search_id
+        self.cancelled = threading.Event()
+        self.results = None # asyncio.Queue, created on the event loop
+
+
+class SearchService:
+    """Runs searches for HTTP clients on a shared, bounded thread pool."""
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self.searches = {}
+        self._ids = itertools.count(1)
+
+    def close(self):
+        for search in self.searches.values():
+            search.cancelled.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle_client(self, reader, writer):
+        try:
+            method, target, body = await self._read_request(reader)
+            url = urlsplit(target)
+            if url.path == "/health" and method == "GET":
+                await self._send_json(writer, 200, {"status": "ok", "active": len(self.searches)})
+            elif url.path == "/search" and method in ("GET", "POST"):
+                await self._run_search(reader, writer, self._search_params(method, url, body))
+            elif url.path.startswith(("/cancel/", "/search/")) and method in ("POST", "DELETE"):
+                search = self.searches.get(unquote(url.path.rsplit("/", 1)[-1]))
+                if search is None:
+                    await self._send_json(writer, 404, {"error": "no such search"})
+                else:
+                    search.cancelled.set()
+                    await self._send_json(writer, 200, {"cancelled": search.id})
+            elif url.path in ("/health", "/search"):
+                await self._send_json(writer, 405, {"error": f"{method} not allowed"})
+            else:
+                await self._send_json(writer, 404, {"error": "not found"})
+        except SearchRequestError as e:
+            await self._send_json(writer, 400, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Parse request line, headers and body (HTTP/1.0 and 1.1, one request per connection)."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise SearchRequestError("request header too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise SearchRequestError("malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise SearchRequestError("invalid Content-Length")
+        if length < 0:
+            raise SearchRequestError("invalid Content-Length")
+        if length > MAX_REQUEST_BYTES:
+            raise SearchRequestError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, body
+
+    def _search_params(self, method, url, body):
+        if method == "POST":
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                raise SearchRequestError("body is not valid JSON")
+            if not isinstance(params, dict):
+                raise SearchRequestError("body must be a JSON object")
+        else:
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            for key in ("include", "exclude"):
+                if key in params:
+                    params[key] = params[key].split(",")
+        query = params.get("query", params.get("q"))
+        path = params.get("path")
+        if not isinstance(query, str) or not query.strip():
+            raise SearchRequestError("missing query")
+        if not isinstance(path, str) or not path:
+            raise SearchRequestError("missing path")
+        params["query"] = query.strip()
+        return params
+
+    @staticmethod
+    def _int_params(params, keys):
+        """{key: int value} for the keys present in params."""
+        values = {}
+        for key in keys:
+            if params.get(key) not in (None, ""):
+                try:
+                    values[key] = int(params[key])
+                except (TypeError, ValueError):
+                    raise SearchRequestError(f"{key} must be an integer")
+                if values[key] < 0:
+                    raise SearchRequestError(f"{key} must not be negative")
+        return values
+
+    @classmethod
+    def _file_filter(cls, params):
+        kwargs = cls._int_params(params, ("max_depth", "max_file_size"))
+        for key in ("include", "exclude"):
+            if params.get(key):
+                kwargs[key] = params[key]
+        try:
+            return FileFilter(**kwargs)
+        except ValueError as e: # Invalid glob, e.g. [z-a]
+            raise SearchRequestError(str(e))
+
+    async def _run_search(self, reader, writer, params):
+        loop = asyncio.get_running_loop()
+        file_filter = self._file_filter(params)
+        limits = self._int_params(params, ("max_lines", "memory_mb"))
+        search = _Search(str(next(self._ids)))
+        search.results = asyncio.Queue(RESULT_QUEUE_SIZE)
+        self.searches[search.id] = search
+        # The client sends nothing after its request, so EOF here means it hung up
+        hangup = asyncio.ensure_future(reader.read(1))
+        hangup.add_done_callback(lambda _: search.cancelled.set())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"X-Search-Id: " + search.id.encode() + b"\r\nConnection: close\r\n\r\n")
+        try:
+            await self._write_line(writer, {"type": "start", "id": search.id})
+            worker = loop.run_in_executor(self.pool, self._search_worker, loop, search, params, file_filter,
+                                          limits)
+            while True:
+                message = await search.results.get()
+                if message is None:
+                    break
+                await self._write_line(writer, message)
+            await worker
+        except (ConnectionError, asyncio.CancelledError):
+            # Client went away: stop the scan and unblock it if it waits on a full queue
+            search.cancelled.set()
+            while not search.results.empty():
+                search.results.get_nowait()
+            raise
+        finally:
+            hangup.cancel()
+            self.searches.pop(search.id, None)
+
+    def _search_worker(self, loop, search, params, file_filter, limits):
+        """Runs on the shared pool: scan the manifest and hand messages to the event loop."""
+        def emit(message):
+            # Blocks while the client's queue is full (backpressure) but wakes up on cancel
+            future = asyncio.run_coroutine_threadsafe(search.results.put(message), loop)
+            while not search.cancelled.is_set():
+                try:
+                    return future.result(timeout=0.2)
+                except FutureTimeoutError:
+                    continue
+            future.cancel()
+
+        def lines_left():
+            if "max_lines" not in limits:
+                return budget.lines_left()
+            return max(0, min(budget.lines_left(), limits["max_lines"] - len(table)))
+
+        table = MatchTable()
+        # Lines are streamed out, not kept: only the table records count against the budget
+        budget = MemoryBudget(limits["memory_mb"] * 1024 * 1024 if limits.get("memory_mb") else None)
+        files = unlisted_hits = unlisted_files = 0
+        final = None
+        try:
+            manifest = build_manifest(params["path"], file_filter)
+            query = parse_query(params["query"])
+            if query is not None:
+                scan = lambda entry, binary_file: scan_structured(binary_file, query, entry.label,
+                                                                  max_lines=lines_left())
+            else:
+                scan = lambda entry, binary_file: scan_matches(binary_file, params["query"], max_lines=lines_left())
+            # max_workers=1: no extra threads per search beyond the shared pool
+            for entry, file_matches, error in scan_manifest(manifest, scan, search.cancelled.is_set, max_workers=1):
+                files += 1
+                if error is not None:
+                    emit({"type": "file_error", "file": entry.label, "error": str(error)})
+                    continue
+                if (isinstance(file_matches, int) or len(file_matches.line_nos) > lines_left()
+                        or not budget.charge(matches_memory(file_matches, shown=0))):
+                    hits = file_matches if isinstance(file_matches, int) else sum(file_matches.hit_flags)
+                    if hits:
+                        unlisted_hits += hits
+                        unlisted_files += 1
+                        emit({"type": "file_hits", "file": entry.label, "hits": hits})
+                    continue
+                start, stop = table.add_file(entry, file_matches)
+                for block_start, block_stop in table.iter_blocks(start, stop):
+                    emit({
+                        "type": "block",
+                        "file": entry.label,
+                        "lines": [{"line": table.line_nos[i], "offset": table.offsets[i],
+                                   "hit": bool(table.hit_flags[i]), "text": file_matches.lines[i - start]}
+                                  for i in range(block_start, block_stop)]
+                    })
+            if search.cancelled.is_set():
+                final = {"type": "cancelled", "files": files}
+            else:
+                final = {"type": "done", "files": files, "hits": table.hit_count, "lines": len(table),
+                         "unlisted_hits": unlisted_hits, "unlisted_files": unlisted_files}
+        except Exception as e:
+            final = {"type": "error", "error": str(e)}
+        finally:
+            # Final message and end-of-stream marker are always delivered so the handler can finish
+            asyncio.run_coroutine_threadsafe(self._finish(search, final), loop)
+
+    @staticmethod
+    async def _finish(search, final):
+        if search.cancelled.is_set():
+            # Results still queued for a cancelled search are dropped to make room
+            while not search.results.empty():
+                search.results.get_nowait()
+        if final is not None:
+            await search.results.put(final)
+        await search.results.put(None)
+
+    @staticmethod
+    async def _write_line(writer, message):
+        writer.write(json.dumps(message).encode("utf-8") + b"\n")
+        await writer.drain() # Backpressure: wait while the client is not reading
+
+    @staticmethod
+    async def _send_json(writer, status, message):
+        payload = json.dumps(message).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {_STATUS_TEXT[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+        await writer.drain()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, workers=DEFAULT_WORKERS, ready=None):
+    """Run the service until cancelled. ready(server) is called once it is listening."""
+    service = SearchService(workers)
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_client, path=unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_client, host, port)
+    if ready is not None:
+        ready(server)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve log searches over a local HTTP/JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="searches that can scan at the same time")
+    args = parser.parse_args(argv)
+
+    def announce(server):
+        where = args.unix or "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+        print(f"Log search service listening on {where}", flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, ready=announce))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()